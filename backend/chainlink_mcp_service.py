@@ -6,6 +6,7 @@ Provides integration with Chainlink price feeds, oracle data, and CCIP functiona
 import asyncio
 import json
 import logging
+import statistics
 from typing import Dict, List, Optional, Any
 import httpx
 from datetime import datetime, timedelta
@@ -62,11 +63,11 @@ class ChainlinkMCPService:
         """Get latest price from Chainlink price feed"""
         try:
             if symbol not in self.price_feeds:
-                logger.warning(f"Price feed not available for {symbol}")
+                logger.warning("Price feed not available for %s", symbol)
                 return None
                 
             if chain not in self.price_feeds[symbol]:
-                logger.warning(f"Price feed for {symbol} not available on {chain}")
+                logger.warning("Price feed for %s not available on %s", symbol, chain)
                 return None
                 
             feed_address = self.price_feeds[symbol][chain]
@@ -95,11 +96,11 @@ class ChainlinkMCPService:
                     "feed_address": feed_address
                 }
             else:
-                logger.error(f"Failed to get price feed for {symbol}: {response.status_code}")
+                logger.error("Failed to get price feed for %s: %s", symbol, response.status_code)
                 return None
                 
         except Exception as e:
-            logger.error(f"Error getting price feed for {symbol}: {str(e)}")
+            logger.error("Error getting price feed for %s: %s", symbol, e)
             return None
 
     async def get_multiple_prices(self, symbols: List[str], chain: str = "ethereum") -> Dict[str, Any]:
@@ -120,7 +121,7 @@ class ChainlinkMCPService:
             return price_data
             
         except Exception as e:
-            logger.error(f"Error getting multiple prices: {str(e)}")
+            logger.error("Error getting multiple prices: %s", e)
             return {}
 
     async def get_historical_prices(self, symbol: str, chain: str = "ethereum", 
@@ -148,11 +149,11 @@ class ChainlinkMCPService:
                 data = response.json()
                 return data.get("historical_data", [])
             else:
-                logger.error(f"Failed to get historical prices for {symbol}: {response.status_code}")
+                logger.error("Failed to get historical prices for %s: %s", symbol, response.status_code)
                 return []
                 
         except Exception as e:
-            logger.error(f"Error getting historical prices for {symbol}: {str(e)}")
+            logger.error("Error getting historical prices for %s: %s", symbol, e)
             return []
 
     async def get_price_volatility(self, symbol: str, chain: str = "ethereum", 
@@ -167,7 +168,6 @@ class ChainlinkMCPService:
             prices = [float(item["price"]) for item in historical_data]
             
             # Calculate volatility metrics
-            import statistics
             mean_price = statistics.mean(prices)
             variance = statistics.variance(prices)
             volatility = (variance ** 0.5) / mean_price * 100  # Percentage volatility
@@ -189,7 +189,7 @@ class ChainlinkMCPService:
             }
             
         except Exception as e:
-            logger.error(f"Error calculating volatility for {symbol}: {str(e)}")
+            logger.error("Error calculating volatility for %s: %s", symbol, e)
             return None
 
     async def get_cross_chain_prices(self, symbol: str) -> Dict[str, Any]:
@@ -215,7 +215,7 @@ class ChainlinkMCPService:
             return cross_chain_data
             
         except Exception as e:
-            logger.error(f"Error getting cross-chain prices for {symbol}: {str(e)}")
+            logger.error("Error getting cross-chain prices for %s: %s", symbol, e)
             return {}
 
     async def get_supported_feeds(self) -> Dict[str, List[str]]:
@@ -229,7 +229,7 @@ class ChainlinkMCPService:
             return supported_feeds
             
         except Exception as e:
-            logger.error(f"Error getting supported feeds: {str(e)}")
+            logger.error("Error getting supported feeds: %s", e)
             return {}
 
     async def get_feed_health(self, symbol: str, chain: str = "ethereum") -> Optional[Dict[str, Any]]:
@@ -258,7 +258,7 @@ class ChainlinkMCPService:
             }
             
         except Exception as e:
-            logger.error(f"Error checking feed health for {symbol}: {str(e)}")
+            logger.error("Error checking feed health for %s: %s", symbol, e)
             return None
 
     async def get_oracle_network_status(self) -> Dict[str, Any]:
@@ -275,11 +275,11 @@ class ChainlinkMCPService:
             if response.status_code == 200:
                 return response.json()
             else:
-                logger.error(f"Failed to get oracle network status: {response.status_code}")
+                logger.error("Failed to get oracle network status: %s", response.status_code)
                 return {"status": "unknown", "error": "Failed to fetch network status"}
                 
         except Exception as e:
-            logger.error(f"Error getting oracle network status: {str(e)}")
+            logger.error("Error getting oracle network status: %s", e)
             return {"status": "error", "error": str(e)}
 
     async def health_check(self) -> Dict[str, Any]:
@@ -0,0 +1,18 @@
+"""
+Gunicorn configuration for DeFiGuard Risk Backend
+Runs the FastAPI app on Uvicorn workers that share the listening port via SO_REUSEPORT
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WORKER_PROCESSES", multiprocessing.cpu_count()))
+
+# Each worker binds its own socket so the kernel balances accept() across them
+reuse_port = True
+
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+accesslog = "-"
+errorlog = "-"
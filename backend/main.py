@@ -3,17 +3,24 @@ DeFiGuard Risk - FastAPI Backend Application
 Multi-chain DeFi portfolio management with AI-powered insights
 """
 
+import asyncio
+import functools
+import hashlib
 import os
+import statistics
 import sys
 from contextlib import asynccontextmanager
-from typing import List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 
-from fastapi import FastAPI, HTTPException, Depends, Query, Path
+from fastapi import FastAPI, HTTPException, Depends, Query, Path, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
 from loguru import logger
+import orjson
+from pydantic import BaseModel
 import uvicorn
 
 # Import our services and models
@@ -21,10 +28,12 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from services.coinbase_service import DeFiGuardCoinbaseService, create_coinbase_service
 from services.graph_service import DeFiGuardGraphService, create_graph_service
-from services.risk_analysis_service import get_risk_analysis_service, RiskAnalysisService
+from services.risk_analysis_service import get_risk_analysis_service, risk_analysis_service, RiskAnalysisService
 from models.api_models import (
     PortfolioResponse, PortfolioRequest, PriceResponse, PriceRequest,
-    HealthResponse, ErrorResponse, SuccessResponse, ChainId,
+    HealthResponse, ErrorResponse, SuccessResponse,
+    SUPPORTED_CHAIN_NAMES,
+    normalize_address, validate_chain_ids,
     TokenBalanceResponse, ChainBalanceResponse,
     # Risk Analysis Models
     RiskAnalysisRequest, CompleteRiskAnalysisResponse,
@@ -37,12 +46,14 @@ from models.api_models import (
     ChainlinkFeedHealthResponse, ChainlinkNetworkStatusResponse,
     ChainlinkHealthCheckResponse
 )
+from models.portfolio_models import ChainBalance, sum_usd
 from config import settings
 
 # Using settings from config.py
 
 # Global service instances
 coinbase_service: Optional[DeFiGuardCoinbaseService] = None
+graph_service: Optional[DeFiGuardGraphService] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -50,7 +61,7 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting DeFiGuard Risk API...")
     
-    global coinbase_service
+    global coinbase_service, graph_service
     
     try:
         # Initialize services
@@ -65,6 +76,12 @@ async def lifespan(app: FastAPI):
         )
         
         await coinbase_service.initialize()
+        
+        # Historical data from The Graph is optional
+        if settings.graph_api_key:
+            graph_service = create_graph_service(settings.graph_api_key, settings.redis_url)
+            await graph_service.initialize()
+        
         logger.info("✅ Services initialized successfully")
         
     except Exception as e:
@@ -77,8 +94,35 @@ async def lifespan(app: FastAPI):
     logger.info("🔒 Shutting down DeFiGuard Risk API...")
     if coinbase_service:
         await coinbase_service.close()
+    if graph_service:
+        await graph_service.close()
+    await risk_analysis_service.close()
     logger.info("✅ Shutdown complete")
 
+class PydanticJSONRoute(APIRoute):
+    """
+    API route that serializes Pydantic responses in a single pydantic-core pass
+    
+    Endpoints returning a model are rendered with model_dump_json() directly,
+    skipping FastAPI's re-validation and jsonable_encoder walk of the result.
+    """
+    
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        if asyncio.iscoroutinefunction(endpoint):
+            original_endpoint = endpoint
+            
+            @functools.wraps(original_endpoint)
+            async def endpoint(*args: Any, **endpoint_kwargs: Any) -> Any:
+                content = await original_endpoint(*args, **endpoint_kwargs)
+                if isinstance(content, BaseModel):
+                    return Response(
+                        content=content.model_dump_json(by_alias=True),
+                        media_type="application/json"
+                    )
+                return content
+        
+        super().__init__(path, endpoint, **kwargs)
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.app_name,
@@ -86,8 +130,10 @@ app = FastAPI(
     description=settings.app_description,
     docs_url="/docs" if settings.debug else None,
     redoc_url="/redoc" if settings.debug else None,
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
+app.router.route_class = PydanticJSONRoute
 
 # Middleware
 app.add_middleware(
@@ -110,28 +156,105 @@ async def get_coinbase_service() -> DeFiGuardCoinbaseService:
         )
     return coinbase_service
 
+# Response helpers
+def serialize_with_etag(model: BaseModel) -> Tuple[bytes, str]:
+    """Serialize a response model and derive its strong ETag"""
+    body = model.model_dump_json().encode()
+    return body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def conditional_json_response(request: Request, model: BaseModel) -> Response:
+    """
+    Serialize a response model with an ETag header
+    
+    Returns 304 Not Modified with an empty body when the client's
+    If-None-Match already carries the current ETag.
+    """
+    return conditional_body_response(request, *serialize_with_etag(model))
+
+def conditional_body_response(request: Request, body: bytes, etag: str) -> Response:
+    """Conditional JSON response for an already serialized body and its ETag"""
+    headers = {"ETag": etag}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Interned chain names, token symbols and token names shared across responses.
+# Bounded so arbitrary token metadata cannot grow it without limit.
+_INTERN_CACHE_SIZE = 4096
+_interned_labels: Dict[str, str] = {
+    name: name for name in map(sys.intern, SUPPORTED_CHAIN_NAMES)
+}
+
+def intern_label(value: str) -> str:
+    """Return the canonical interned copy of a repeated response label"""
+    interned = _interned_labels.get(value)
+    if interned is None:
+        if len(_interned_labels) >= _INTERN_CACHE_SIZE:
+            return value
+        interned = _interned_labels[value] = sys.intern(value)
+    return interned
+
+def build_portfolio_response(address: str, chain_balances: List[ChainBalance]) -> PortfolioResponse:
+    """
+    Convert service balances into a portfolio response
+    
+    The balances come from our own dataclasses and the address has already
+    been validated, so models are built with model_construct() to skip
+    per-token validation.
+    """
+    portfolio_chains = [
+        ChainBalanceResponse.model_construct(
+            chain_id=chain_balance.chain_id,
+            chain_name=intern_label(chain_balance.chain_name),
+            tokens=[
+                TokenBalanceResponse.model_construct(
+                    address=token.address,
+                    symbol=intern_label(token.symbol),
+                    name=intern_label(token.name),
+                    balance=token.balance,
+                    decimals=token.decimals,
+                    price_usd=token.price_usd,
+                    value_usd=token.value_usd,
+                    logo_url=token.logo_url
+                ) for token in chain_balance.tokens
+            ],
+            total_value_usd=chain_balance.total_value_usd
+        ) for chain_balance in chain_balances
+    ]
+    
+    return PortfolioResponse.model_construct(
+        address=address.lower(),
+        total_value_usd=sum_usd(cb.total_value_usd for cb in chain_balances),
+        chains=portfolio_chains,
+        supported_networks=len(portfolio_chains),
+        last_updated=datetime.utcnow()
+    )
+
 # Exception handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     """Handle HTTP exceptions"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content=ErrorResponse(
             error=exc.detail,
             detail=f"HTTP {exc.status_code}"
-        ).dict()
+        ).model_dump()
     )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     """Handle general exceptions"""
     logger.error(f"Unhandled exception: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content=ErrorResponse(
             error="Internal server error",
             detail=str(exc) if settings.debug else "An unexpected error occurred"
-        ).dict()
+        ).model_dump()
     )
 
 # Health check endpoint
@@ -162,7 +285,7 @@ async def root():
             "version": settings.app_version,
             "description": settings.app_description,
             "docs": "/docs" if settings.debug else "Not available in production",
-            "supported_chains": [chain.name.title() for chain in ChainId],
+            "supported_chains": SUPPORTED_CHAIN_NAMES,
             "features": [
                 "Multi-chain portfolio aggregation",
                 "Real-time balance fetching", 
@@ -190,7 +313,9 @@ async def get_portfolio(
     """
     try:
         # Validate address format
-        if not address.startswith('0x') or len(address) != 42:
+        try:
+            address = normalize_address(address)
+        except ValueError:
             raise HTTPException(
                 status_code=400, 
                 detail="Invalid address format. Must be 42-character hex string starting with 0x"
@@ -198,13 +323,10 @@ async def get_portfolio(
         
         # Validate chain IDs
         if chains:
-            valid_chains = [chain.value for chain in ChainId]
-            invalid_chains = [c for c in chains if c not in valid_chains]
-            if invalid_chains:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Unsupported chain IDs: {invalid_chains}. Supported: {valid_chains}"
-                )
+            try:
+                validate_chain_ids(chains)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
         
         logger.info(f"🔍 Fetching portfolio for {address} on chains: {chains or 'all'}")
         
@@ -212,45 +334,9 @@ async def get_portfolio(
         chain_balances = await service.get_portfolio_balances(address, chains)
         
         # Convert to response format
-        portfolio_chains = []
-        total_portfolio_value = 0.0
+        portfolio_response = build_portfolio_response(address, chain_balances)
         
-        for chain_balance in chain_balances:
-            # Convert tokens
-            token_responses = []
-            for token in chain_balance.tokens:
-                token_responses.append(TokenBalanceResponse(
-                    address=token.address,
-                    symbol=token.symbol,
-                    name=token.name,
-                    balance=token.balance,
-                    decimals=token.decimals,
-                    price_usd=token.price_usd,
-                    value_usd=token.value_usd,
-                    logo_url=token.logo_url
-                ))
-            
-            # Create chain response
-            chain_response = ChainBalanceResponse(
-                chain_id=chain_balance.chain_id,
-                chain_name=chain_balance.chain_name,
-                tokens=token_responses,
-                total_value_usd=chain_balance.total_value_usd
-            )
-            
-            portfolio_chains.append(chain_response)
-            total_portfolio_value += chain_balance.total_value_usd
-        
-        # Create portfolio response
-        portfolio_response = PortfolioResponse(
-            address=address.lower(),
-            total_value_usd=total_portfolio_value,
-            chains=portfolio_chains,
-            supported_networks=len(chain_balances),
-            last_updated=datetime.utcnow()
-        )
-        
-        logger.info(f"✅ Portfolio fetched: ${total_portfolio_value:.2f} across {len(portfolio_chains)} chains")
+        logger.info(f"✅ Portfolio fetched: ${portfolio_response.total_value_usd:.2f} across {len(portfolio_response.chains)} chains")
         return portfolio_response
         
     except HTTPException:
@@ -281,44 +367,7 @@ async def get_portfolios_batch(
         try:
             # Reuse the single portfolio endpoint logic
             chain_balances = await service.get_portfolio_balances(request.address, request.chains)
-            
-            # Convert to response format (similar to single endpoint)
-            portfolio_chains = []
-            total_portfolio_value = 0.0
-            
-            for chain_balance in chain_balances:
-                token_responses = [
-                    TokenBalanceResponse(
-                        address=token.address,
-                        symbol=token.symbol,
-                        name=token.name,
-                        balance=token.balance,
-                        decimals=token.decimals,
-                        price_usd=token.price_usd,
-                        value_usd=token.value_usd,
-                        logo_url=token.logo_url
-                    ) for token in chain_balance.tokens
-                ]
-                
-                chain_response = ChainBalanceResponse(
-                    chain_id=chain_balance.chain_id,
-                    chain_name=chain_balance.chain_name,
-                    tokens=token_responses,
-                    total_value_usd=chain_balance.total_value_usd
-                )
-                
-                portfolio_chains.append(chain_response)
-                total_portfolio_value += chain_balance.total_value_usd
-            
-            portfolio_response = PortfolioResponse(
-                address=request.address.lower(),
-                total_value_usd=total_portfolio_value,
-                chains=portfolio_chains,
-                supported_networks=len(portfolio_chains),
-                last_updated=datetime.utcnow()
-            )
-            
-            results.append(portfolio_response)
+            results.append(build_portfolio_response(request.address, chain_balances))
             
         except Exception as e:
             logger.error(f"Error in batch request for {request.address}: {e}")
@@ -415,7 +464,9 @@ async def analyze_portfolio_risk(
     """
     try:
         # Validate address format
-        if not address.startswith('0x') or len(address) != 42:
+        try:
+            address = normalize_address(address)
+        except ValueError:
             raise HTTPException(
                 status_code=400,
                 detail="Invalid address format. Must be 42-character hex string starting with 0x"
@@ -634,7 +685,7 @@ async def chainlink_health_check():
             health_data = await service.health_check()
             return ChainlinkHealthCheckResponse(**health_data)
     except Exception as e:
-        logger.error(f"Chainlink health check failed: {e}")
+        logger.opt(exception=e).error("Chainlink health check failed")
         raise HTTPException(status_code=503, detail="Chainlink MCP service unavailable")
 
 
@@ -664,8 +715,8 @@ async def get_chainlink_price(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching Chainlink price for {symbol}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch price: {str(e)}")
+        logger.opt(exception=e).error("Error fetching Chainlink price for {}", symbol)
+        raise HTTPException(status_code=500, detail="Failed to fetch price")
 
 
 @app.get("/chainlink/prices", response_model=ChainlinkMultiplePricesResponse, tags=["Chainlink MCP"])
@@ -697,8 +748,8 @@ async def get_chainlink_multiple_prices(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching multiple Chainlink prices: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch prices: {str(e)}")
+        logger.opt(exception=e).error("Error fetching multiple Chainlink prices")
+        raise HTTPException(status_code=500, detail="Failed to fetch prices")
 
 
 @app.get("/chainlink/price/{symbol}/history", response_model=ChainlinkHistoricalPricesResponse, tags=["Chainlink MCP"])
@@ -734,8 +785,58 @@ async def get_chainlink_historical_prices(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching historical prices for {symbol}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch historical data: {str(e)}")
+        logger.opt(exception=e).error("Error fetching historical prices for {}", symbol)
+        raise HTTPException(status_code=500, detail="Failed to fetch historical data")
+
+
+@app.get("/chainlink/price/{symbol}/history/stream", tags=["Chainlink MCP"])
+async def stream_chainlink_historical_prices(
+    symbol: str = Path(..., description="Price pair symbol"),
+    chain: str = Query("ethereum", description="Blockchain network"),
+    days: int = Query(30, description="Number of days of historical data")
+):
+    """
+    Stream historical price data from Chainlink price feeds as NDJSON
+    
+    Emits one JSON object per line (timestamp, price, round_id). The points
+    are fetched in full first, so a failed or empty fetch is reported as an
+    error status; only the response encoding is streamed, which avoids
+    building the full response model.
+    
+    - **symbol**: Price pair symbol (ETH/USD, BTC/USD, etc.)
+    - **chain**: Blockchain network
+    - **days**: Number of days of historical data (1-365)
+    """
+    if days < 1 or days > 365:
+        raise HTTPException(
+            status_code=400,
+            detail="Days must be between 1 and 365"
+        )
+    
+    try:
+        async with chainlink_mcp_service as service:
+            historical_data = await service.get_historical_prices(symbol, chain, days)
+    except Exception as e:
+        logger.opt(exception=e).error("Error fetching historical prices for {}", symbol)
+        raise HTTPException(status_code=500, detail="Failed to fetch historical data")
+    
+    # get_historical_prices returns [] for unknown feeds and upstream failures
+    if not historical_data:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No historical data for {symbol} on {chain}"
+        )
+    
+    # Async generator: a sync one would be iterated on the threadpool
+    async def ndjson_lines():
+        for point in historical_data:
+            yield orjson.dumps({
+                "timestamp": point.get("timestamp"),
+                "price": float(point["price"]),
+                "round_id": str(point.get("round_id"))
+            }) + b"\n"
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
 
 @app.get("/chainlink/price/{symbol}/volatility", response_model=ChainlinkVolatilityResponse, tags=["Chainlink MCP"])
@@ -772,8 +873,8 @@ async def get_chainlink_price_volatility(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error calculating volatility for {symbol}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to calculate volatility: {str(e)}")
+        logger.opt(exception=e).error("Error calculating volatility for {}", symbol)
+        raise HTTPException(status_code=500, detail="Failed to calculate volatility")
 
 
 @app.get("/chainlink/price/{symbol}/cross-chain", response_model=ChainlinkCrossChainPricesResponse, tags=["Chainlink MCP"])
@@ -800,7 +901,6 @@ async def get_chainlink_cross_chain_prices(
             # Calculate price variance across chains
             prices = [data["price"] for data in cross_chain_data.values()]
             if len(prices) > 1:
-                import statistics
                 price_variance = statistics.variance(prices)
             else:
                 price_variance = 0.0
@@ -814,32 +914,45 @@ async def get_chainlink_cross_chain_prices(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching cross-chain prices for {symbol}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch cross-chain data: {str(e)}")
+        logger.opt(exception=e).error("Error fetching cross-chain prices for {}", symbol)
+        raise HTTPException(status_code=500, detail="Failed to fetch cross-chain data")
+
 
+# Serialized /chainlink/feeds response: (feeds mapping, JSON body, ETag)
+_supported_feeds_cache: Optional[Tuple[Dict[str, List[str]], bytes, str]] = None
 
 @app.get("/chainlink/feeds", response_model=ChainlinkSupportedFeedsResponse, tags=["Chainlink MCP"])
-async def get_chainlink_supported_feeds():
+async def get_chainlink_supported_feeds(request: Request):
     """
     Get all supported Chainlink price feed symbols and chains
+    
+    Supports conditional requests: send the returned ETag in If-None-Match
+    to receive 304 Not Modified while the feed list is unchanged.
     """
     try:
         async with chainlink_mcp_service as service:
             supported_feeds = await service.get_supported_feeds()
             
-            # Get unique chains
-            all_chains = set()
-            for chains in supported_feeds.values():
-                all_chains.update(chains)
+            # The feed list only changes on redeploy, so reuse the serialized
+            # body and ETag until the service reports a different mapping
+            global _supported_feeds_cache
+            if _supported_feeds_cache is None or _supported_feeds_cache[0] != supported_feeds:
+                # Get unique chains (sorted so the ETag is stable across workers)
+                all_chains = set()
+                for chains in supported_feeds.values():
+                    all_chains.update(chains)
                 
-            return ChainlinkSupportedFeedsResponse(
-                feeds=supported_feeds,
-                total_feeds=len(supported_feeds),
-                chains=list(all_chains)
-            )
+                _supported_feeds_cache = (supported_feeds, *serialize_with_etag(ChainlinkSupportedFeedsResponse(
+                    feeds=supported_feeds,
+                    total_feeds=len(supported_feeds),
+                    chains=sorted(all_chains)
+                )))
+            
+            _, body, etag = _supported_feeds_cache
+            return conditional_body_response(request, body, etag)
             
     except Exception as e:
-        logger.error(f"Error fetching supported feeds: {e}")
+        logger.opt(exception=e).error("Error fetching supported feeds")
         raise HTTPException(status_code=500, detail="Failed to fetch supported feeds")
 
 
@@ -871,23 +984,25 @@ async def get_chainlink_feed_health(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error checking feed health for {symbol}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to check feed health: {str(e)}")
+        logger.opt(exception=e).error("Error checking feed health for {}", symbol)
+        raise HTTPException(status_code=500, detail="Failed to check feed health")
 
 
 @app.get("/chainlink/network/status", response_model=ChainlinkNetworkStatusResponse, tags=["Chainlink MCP"])
-async def get_chainlink_network_status():
+async def get_chainlink_network_status(request: Request):
     """
     Get overall Chainlink oracle network status
+    
+    Supports conditional requests via ETag / If-None-Match.
     """
     try:
         async with chainlink_mcp_service as service:
             network_status = await service.get_oracle_network_status()
             
-            return ChainlinkNetworkStatusResponse(**network_status)
+            return conditional_json_response(request, ChainlinkNetworkStatusResponse(**network_status))
             
     except Exception as e:
-        logger.error(f"Error fetching network status: {e}")
+        logger.opt(exception=e).error("Error fetching network status")
         raise HTTPException(status_code=500, detail="Failed to fetch network status")
 
 
@@ -920,11 +1035,15 @@ if __name__ == "__main__":
     logger.info("🚀 Starting DeFiGuard Risk API server...")
     
     # Run the server
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=settings.debug,
-        workers=1 if settings.debug else 4,
-        log_level="debug" if settings.debug else "info"
-    )
+    if settings.debug:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            loop="uvloop",
+            log_level="debug"
+        )
+    else:
+        # Gunicorn manages Uvicorn workers that share the port via SO_REUSEPORT
+        os.execvp("gunicorn", ["gunicorn", "main:app", "-c", "gunicorn.conf.py"])
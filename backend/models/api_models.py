@@ -3,10 +3,14 @@ API Models for DeFiGuard Risk Backend
 Pydantic models for request/response schemas
 """
 
-from typing import Dict, List, Optional, Any
-from datetime import datetime
-from decimal import Decimal
-from pydantic import BaseModel, Field, validator
+import functools
+import re
+import time
+from typing import Annotated, Dict, Final, FrozenSet, List, Literal, Optional, Sequence, Tuple, Any, get_args
+from datetime import datetime, timedelta, timezone
+from pydantic import (
+    BaseModel, BeforeValidator, ConfigDict, Field, PlainSerializer, PositiveFloat, WithJsonSchema, field_validator
+)
 from enum import Enum
 
 
@@ -19,6 +23,72 @@ class ChainId(int, Enum):
     BASE = 8453
 
 
+# Chain IDs accepted by request validation
+_VALID_CHAIN_IDS: FrozenSet[int] = frozenset(chain.value for chain in ChainId)
+
+# Plain-int chain ID annotation, validated as a literal set by pydantic-core
+ChainIdT = Literal[1, 10, 137, 8453, 42161]
+assert frozenset(get_args(ChainIdT)) == _VALID_CHAIN_IDS, "ChainIdT is out of sync with ChainId"
+
+# Display names and count of the supported networks, computed once at import
+SUPPORTED_CHAIN_NAMES: Final[Tuple[str, ...]] = tuple(chain.name.title() for chain in ChainId)
+SUPPORTED_NETWORK_COUNT: Final[int] = len(SUPPORTED_CHAIN_NAMES)
+
+# 0x-prefixed 20-byte hex wallet address
+_ADDRESS_RE = re.compile(r'0x[0-9a-fA-F]{40}')
+
+
+# Naive UTC epoch, matching the naive ISO strings the API has always returned
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _now_ms() -> int:
+    """Current wall-clock time as integer epoch milliseconds"""
+    return time.time_ns() // 1_000_000
+
+
+def _epoch_ms_to_isoformat(value: int) -> str:
+    """Render epoch milliseconds as a naive UTC ISO-8601 string"""
+    return (_EPOCH + timedelta(milliseconds=value)).isoformat()
+
+
+def _to_epoch_ms(value: Any) -> Any:
+    """Accept datetimes and ISO-8601 strings as well as epoch milliseconds"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (value - _EPOCH) // timedelta(milliseconds=1)
+    return value
+
+
+# Response timestamp captured as epoch milliseconds and only formatted on dump;
+# the published schema (both modes) is the ISO string that goes on the wire
+EpochTimestamp = Annotated[
+    int,
+    BeforeValidator(_to_epoch_ms),
+    PlainSerializer(_epoch_ms_to_isoformat, return_type=str),
+    WithJsonSchema({"type": "string", "format": "date-time"})
+]
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_address(address: str) -> str:
+    """Validate a wallet address and return it lowercased (memoized per address)"""
+    if not _ADDRESS_RE.fullmatch(address):
+        raise ValueError('Address must be 0x followed by 40 hex characters')
+    return address if address.islower() else address.lower()
+
+
+def validate_chain_ids(chain_ids: Sequence[int]) -> Sequence[int]:
+    """Ensure every chain ID belongs to a supported network"""
+    invalid_chains = [chain_id for chain_id in chain_ids if chain_id not in _VALID_CHAIN_IDS]
+    if invalid_chains:
+        raise ValueError(f'Unsupported chain IDs: {invalid_chains}. Supported: {sorted(_VALID_CHAIN_IDS)}')
+    return chain_ids
+
+
 class TokenBalanceResponse(BaseModel):
     """Token balance data response"""
     address: str = Field(..., description="Token contract address")
@@ -33,7 +103,7 @@ class TokenBalanceResponse(BaseModel):
 
 class ChainBalanceResponse(BaseModel):
     """Chain balance data response"""
-    chain_id: int = Field(..., description="Blockchain network ID")
+    chain_id: ChainIdT = Field(..., description="Blockchain network ID")
     chain_name: str = Field(..., description="Blockchain network name")
     tokens: List[TokenBalanceResponse] = Field(..., description="List of token balances")
     total_value_usd: float = Field(..., description="Total value in USD for this chain")
@@ -46,34 +116,17 @@ class PortfolioResponse(BaseModel):
     chains: List[ChainBalanceResponse] = Field(..., description="Balance data for each chain")
     supported_networks: int = Field(..., description="Number of supported networks")
     last_updated: datetime = Field(..., description="Timestamp of last data update")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class PortfolioRequest(BaseModel):
     """Portfolio fetch request"""
     address: str = Field(..., description="Wallet address to fetch portfolio for", min_length=42, max_length=42)
-    chains: Optional[List[int]] = Field(None, description="Specific chain IDs to fetch (optional)")
-    
-    @validator('address')
-    def validate_address(cls, v):
-        if not v.startswith('0x'):
-            raise ValueError('Address must start with 0x')
-        if len(v) != 42:
-            raise ValueError('Address must be 42 characters long')
-        return v.lower()
+    chains: Optional[Tuple[ChainIdT, ...]] = Field(None, description="Specific chain IDs to fetch (optional)")
     
-    @validator('chains')
-    def validate_chains(cls, v):
-        if v is not None:
-            valid_chains = [chain.value for chain in ChainId]
-            for chain_id in v:
-                if chain_id not in valid_chains:
-                    raise ValueError(f'Unsupported chain ID: {chain_id}')
-        return v
+    @field_validator('address')
+    @classmethod
+    def validate_address(cls, v: str) -> str:
+        return normalize_address(v)
 
 
 class PriceRequest(BaseModel):
@@ -87,11 +140,6 @@ class PriceResponse(BaseModel):
     symbol: str = Field(..., description="Token symbol")
     price_usd: float = Field(..., description="Current price in USD")
     last_updated: datetime = Field(..., description="Timestamp of price data")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class HealthResponse(BaseModel):
@@ -101,23 +149,13 @@ class HealthResponse(BaseModel):
     components: Dict[str, str] = Field(..., description="Status of individual components")
     supported_chains: int = Field(..., description="Number of supported blockchain networks")
     timestamp: datetime = Field(..., description="Health check timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class ErrorResponse(BaseModel):
     """Error response model"""
     error: str = Field(..., description="Error message")
     detail: Optional[str] = Field(None, description="Detailed error information")
-    timestamp: datetime = Field(default_factory=datetime.utcnow, description="Error timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    timestamp: EpochTimestamp = Field(default_factory=_now_ms, description="Error timestamp")
 
 
 class SuccessResponse(BaseModel):
@@ -125,12 +163,7 @@ class SuccessResponse(BaseModel):
     success: bool = Field(True, description="Success indicator")
     message: str = Field(..., description="Success message")
     data: Optional[Any] = Field(None, description="Response data")
-    timestamp: datetime = Field(default_factory=datetime.utcnow, description="Response timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    timestamp: EpochTimestamp = Field(default_factory=_now_ms, description="Response timestamp")
 
 
 # Chainlink MCP API Models
@@ -144,23 +177,13 @@ class ChainlinkPriceFeedResponse(BaseModel):
     round_id: str = Field(..., description="Price feed round ID")
     chain: str = Field(..., description="Blockchain network")
     feed_address: str = Field(..., description="Price feed contract address")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class ChainlinkMultiplePricesResponse(BaseModel):
     """Multiple Chainlink price feeds response"""
     prices: Dict[str, ChainlinkPriceFeedResponse] = Field(..., description="Price feed data by symbol")
     chain: str = Field(..., description="Blockchain network")
-    fetched_at: datetime = Field(default_factory=datetime.utcnow, description="Data fetch timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    fetched_at: EpochTimestamp = Field(default_factory=_now_ms, description="Data fetch timestamp")
 
 
 class ChainlinkHistoricalPrice(BaseModel):
@@ -168,11 +191,6 @@ class ChainlinkHistoricalPrice(BaseModel):
     timestamp: datetime = Field(..., description="Price timestamp")
     price: float = Field(..., description="Price value")
     round_id: str = Field(..., description="Round ID")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class ChainlinkHistoricalPricesResponse(BaseModel):
@@ -181,11 +199,6 @@ class ChainlinkHistoricalPricesResponse(BaseModel):
     chain: str = Field(..., description="Blockchain network")
     period_days: int = Field(..., description="Historical data period in days")
     data: List[ChainlinkHistoricalPrice] = Field(..., description="Historical price data")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class ChainlinkVolatilityResponse(BaseModel):
@@ -206,16 +219,13 @@ class ChainlinkCrossChainPricesResponse(BaseModel):
     symbol: str = Field(..., description="Price pair symbol")
     chains: Dict[str, ChainlinkPriceFeedResponse] = Field(..., description="Price data by chain")
     price_variance: float = Field(..., description="Price variance across chains")
-    fetched_at: datetime = Field(default_factory=datetime.utcnow, description="Data fetch timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    fetched_at: EpochTimestamp = Field(default_factory=_now_ms, description="Data fetch timestamp")
 
 
 class ChainlinkSupportedFeedsResponse(BaseModel):
     """Supported price feeds response"""
+    model_config = ConfigDict(frozen=True)
+    
     feeds: Dict[str, List[str]] = Field(..., description="Supported symbols and their chains")
     total_feeds: int = Field(..., description="Total number of supported feeds")
     chains: List[str] = Field(..., description="Supported blockchain networks")
@@ -230,11 +240,6 @@ class ChainlinkFeedHealthResponse(BaseModel):
     minutes_since_update: int = Field(..., description="Minutes since last update")
     current_price: float = Field(..., description="Current price")
     round_id: str = Field(..., description="Current round ID")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class ChainlinkNetworkStatusResponse(BaseModel):
@@ -244,11 +249,6 @@ class ChainlinkNetworkStatusResponse(BaseModel):
     total_feeds: Optional[int] = Field(None, description="Total number of price feeds")
     network_health: Optional[str] = Field(None, description="Network health indicator")
     last_update: Optional[datetime] = Field(None, description="Last network status update")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class ChainlinkHealthCheckResponse(BaseModel):
@@ -259,11 +259,6 @@ class ChainlinkHealthCheckResponse(BaseModel):
     sample_feed_working: bool = Field(..., description="Whether sample feed is working")
     supported_symbols: int = Field(..., description="Number of supported symbols")
     timestamp: datetime = Field(..., description="Health check timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 # Future API models for advanced features
@@ -282,11 +277,6 @@ class RiskContributionResponse(BaseModel):
     data: List[RiskContributionData] = Field(..., description="Risk contribution data for each asset")
     total_portfolio_risk: float = Field(..., description="Total portfolio risk percentage")
     analysis_date: datetime = Field(..., description="Analysis timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class CorrelationData(BaseModel):
@@ -307,34 +297,28 @@ class CorrelationSummary(BaseModel):
 class CorrelationResponse(BaseModel):
     """Asset correlation analysis response"""
     data: List[CorrelationData] = Field(..., description="Correlation matrix data")
-    assets: List[str] = Field(..., description="List of assets analyzed")
+    assets: Tuple[str, ...] = Field(..., description="List of assets analyzed")
     summary: CorrelationSummary = Field(..., description="Correlation summary statistics")
     analysis_date: datetime = Field(..., description="Analysis timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
-class FrontierPoint(BaseModel):
+class RiskReturnPoint(BaseModel):
+    """Base for risk/return points serialized with a "return" key"""
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class FrontierPoint(RiskReturnPoint):
     """Efficient frontier data point"""
-    return: float = Field(..., alias="return", description="Expected return percentage")
+    return_: float = Field(..., alias="return", description="Expected return percentage")
     risk: float = Field(..., description="Risk (volatility) percentage")
     sharpe_ratio: float = Field(..., description="Sharpe ratio")
-    
-    class Config:
-        allow_population_by_field_name = True
 
 
-class PortfolioPoint(BaseModel):
+class PortfolioPoint(RiskReturnPoint):
     """Portfolio performance point"""
-    return: float = Field(..., alias="return", description="Portfolio return percentage")
+    return_: float = Field(..., alias="return", description="Portfolio return percentage")
     risk: float = Field(..., description="Portfolio risk percentage")
     sharpe_ratio: float = Field(..., description="Portfolio Sharpe ratio")
-    
-    class Config:
-        allow_population_by_field_name = True
 
 
 class OptimalPortfolios(BaseModel):
@@ -349,11 +333,6 @@ class EfficientFrontierResponse(BaseModel):
     current_portfolio: PortfolioPoint = Field(..., description="Current portfolio position")
     optimal_portfolios: OptimalPortfolios = Field(..., description="Optimal portfolio suggestions")
     analysis_date: datetime = Field(..., description="Analysis timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class PortfolioMetricsResponse(BaseModel):
@@ -367,32 +346,12 @@ class PortfolioMetricsResponse(BaseModel):
     sortino_ratio: float = Field(..., description="Sortino ratio")
     analysis_period_days: int = Field(..., description="Analysis period in days")
     analysis_date: datetime = Field(..., description="Analysis timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class RiskAnalysisRequest(BaseModel):
     """Risk analysis request"""
-    portfolio_data: Dict[str, float] = Field(..., description="Portfolio data mapping symbols to USD values")
-    lookback_days: Optional[int] = Field(365, description="Historical data lookback period in days")
-    
-    @validator('portfolio_data')
-    def validate_portfolio_data(cls, v):
-        if not v:
-            raise ValueError('Portfolio data cannot be empty')
-        for symbol, value in v.items():
-            if value <= 0:
-                raise ValueError(f'Portfolio value for {symbol} must be positive')
-        return v
-    
-    @validator('lookback_days')
-    def validate_lookback_days(cls, v):
-        if v is not None and (v < 30 or v > 1095):
-            raise ValueError('Lookback days must be between 30 and 1095')
-        return v
+    portfolio_data: Dict[str, PositiveFloat] = Field(..., min_length=1, description="Portfolio data mapping symbols to USD values")
+    lookback_days: Optional[int] = Field(365, ge=30, le=1095, description="Historical data lookback period in days")
 
 
 class CompleteRiskAnalysisResponse(BaseModel):
@@ -401,11 +360,6 @@ class CompleteRiskAnalysisResponse(BaseModel):
     correlation: CorrelationResponse = Field(..., description="Asset correlation analysis")
     efficient_frontier: EfficientFrontierResponse = Field(..., description="Efficient frontier analysis")
     portfolio_metrics: PortfolioMetricsResponse = Field(..., description="Comprehensive portfolio metrics")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class AssetRisk(BaseModel):
@@ -426,8 +380,3 @@ class AIRecommendationResponse(BaseModel):
     confidence: float = Field(..., description="AI confidence level (0-1)")
     action_required: bool = Field(..., description="Whether user action is required")
     created_at: datetime = Field(..., description="Recommendation creation time")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
@@ -2,15 +2,15 @@
 Database models for DeFiGuard Risk portfolio data
 """
 
-from typing import Optional, List
+from typing import Iterable, Optional, List
 from datetime import datetime
 from dataclasses import dataclass
-from decimal import Decimal
 
+import numpy as np
 from pydantic import BaseModel, Field
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TokenBalance:
     """Token balance data structure"""
     address: str
@@ -23,7 +23,47 @@ class TokenBalance:
     logo_url: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
+class TokenBalanceBatch:
+    """Column-oriented token balances for vectorized valuation and analytics"""
+    addresses: List[str]
+    symbols: List[str]
+    names: List[str]
+    balances: List[str]  # Keep as string to avoid precision loss
+    decimals: np.ndarray
+    prices_usd: np.ndarray
+    values_usd: np.ndarray
+    logo_urls: List[Optional[str]]
+    
+    def __len__(self) -> int:
+        return len(self.addresses)
+    
+    @property
+    def total_value_usd(self) -> float:
+        """Total USD value, summed in integer micro-USD like sum_usd()"""
+        return int(np.rint(self.values_usd * USD_MICROS).astype(np.int64).sum()) / USD_MICROS
+    
+    def to_aos(self) -> List[TokenBalance]:
+        """Materialize per-token TokenBalance objects for API responses"""
+        return [
+            TokenBalance(
+                address=address,
+                symbol=symbol,
+                name=name,
+                balance=balance,
+                decimals=decimals,
+                price_usd=price_usd,
+                value_usd=value_usd,
+                logo_url=logo_url
+            )
+            for address, symbol, name, balance, decimals, price_usd, value_usd, logo_url in zip(
+                self.addresses, self.symbols, self.names, self.balances,
+                self.decimals.tolist(), self.prices_usd.tolist(), self.values_usd.tolist(), self.logo_urls
+            )
+        ]
+
+
+@dataclass(slots=True, frozen=True)
 class ChainBalance:
     """Chain balance data structure"""
     chain_id: int
@@ -32,7 +72,7 @@ class ChainBalance:
     total_value_usd: float
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Portfolio:
     """Complete portfolio data structure"""
     address: str
@@ -42,6 +82,14 @@ class Portfolio:
     supported_networks: int
 
 
+USD_MICROS = 1_000_000
+
+
+def sum_usd(values: Iterable[float]) -> float:
+    """Sum USD amounts as integer micro-USD so totals are exact and order-independent"""
+    return sum(round(value * USD_MICROS) for value in values) / USD_MICROS
+
+
 # Pydantic models for API validation
 class TokenBalanceModel(BaseModel):
     """Pydantic model for token balance validation"""
@@ -53,9 +101,6 @@ class TokenBalanceModel(BaseModel):
     price_usd: float = Field(..., ge=0, description="Token price in USD")
     value_usd: float = Field(..., ge=0, description="Token value in USD")
     logo_url: Optional[str] = Field(None, description="Token logo URL")
-    
-    class Config:
-        arbitrary_types_allowed = True
 
 
 class ChainBalanceModel(BaseModel):
@@ -64,9 +109,6 @@ class ChainBalanceModel(BaseModel):
     chain_name: str = Field(..., description="Blockchain network name")
     tokens: List[TokenBalanceModel] = Field(..., description="List of token balances")
     total_value_usd: float = Field(..., ge=0, description="Total chain value in USD")
-    
-    class Config:
-        arbitrary_types_allowed = True
 
 
 class PortfolioModel(BaseModel):
@@ -76,6 +118,3 @@ class PortfolioModel(BaseModel):
     chains: List[ChainBalanceModel] = Field(..., description="Chain balance data")
     last_updated: datetime = Field(..., description="Last update timestamp")
     supported_networks: int = Field(..., ge=0, description="Number of supported networks")
-    
-    class Config:
-        arbitrary_types_allowed = True
@@ -4,17 +4,24 @@ Multi-chain portfolio data fetching with rate limiting and caching
 """
 
 import asyncio
+import functools
 import os
-from typing import Dict, List, Optional, Tuple, Any
+import time
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Any
 from decimal import Decimal
-import json
 from datetime import datetime, timezone
-from dataclasses import dataclass
 
 from loguru import logger
+import numpy as np
+import orjson
 import redis.asyncio as redis
 from pydantic import BaseModel
 
+from models.api_models import SUPPORTED_NETWORK_COUNT
+from models.portfolio_models import TokenBalance, TokenBalanceBatch, ChainBalance, sum_usd
+from services.rate_limit import AsyncTokenBucket
+
 # Import Coinbase CDP SDK
 try:
     from cdp import CdpClient
@@ -23,47 +30,76 @@ except ImportError:
     CdpClient = None
 
 
-@dataclass
-class TokenBalance:
-    """Token balance data structure"""
-    address: str
-    symbol: str
-    name: str
-    balance: str
-    decimals: int
-    price_usd: float
-    value_usd: float
-    logo_url: Optional[str] = None
+# Cache encoding: numpy values and datetimes are handled natively by orjson,
+# leaving the str() fallback for rarer types such as Decimal
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+
+
+# Redis connection pools shared by every service instance, keyed by URL
+_REDIS_POOLS: Dict[str, redis.ConnectionPool] = {}
+
+
+def _get_redis_pool(redis_url: str) -> redis.ConnectionPool:
+    """Get or create the shared connection pool for a Redis URL"""
+    pool = _REDIS_POOLS.get(redis_url)
+    if pool is None:
+        pool = _REDIS_POOLS[redis_url] = redis.ConnectionPool.from_url(
+            redis_url,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "20")),
+            # Fail fast instead of stalling the event loop on a hung Redis
+            socket_timeout=1.0,
+            socket_connect_timeout=1.0
+        )
+    return pool
+
+
+# Supported chains mapping (CDP SDK format), read-only at module scope
+CHAIN_MAPPING: Mapping[int, str] = MappingProxyType({
+    1: "ethereum",
+    137: "polygon",
+    42161: "arbitrum",
+    10: "optimism", 
+    8453: "base"
+})
+
+CHAIN_INFO: Mapping[str, Mapping[str, Any]] = MappingProxyType({
+    "ethereum": MappingProxyType({"chain_id": 1, "name": "Ethereum", "native_token": "ETH"}),
+    "polygon": MappingProxyType({"chain_id": 137, "name": "Polygon", "native_token": "MATIC"}),
+    "arbitrum": MappingProxyType({"chain_id": 42161, "name": "Arbitrum", "native_token": "ETH"}),
+    "optimism": MappingProxyType({"chain_id": 10, "name": "Optimism", "native_token": "ETH"}),
+    "base": MappingProxyType({"chain_id": 8453, "name": "Base", "native_token": "ETH"})
+})
+
+
+@functools.lru_cache(maxsize=1)
+def _utc_isoformat(epoch_second: int) -> str:
+    """ISO-8601 UTC timestamp for a whole epoch second"""
+    return datetime.fromtimestamp(epoch_second, timezone.utc).isoformat()
+
+
+def _utc_now_isoformat() -> str:
+    """Current UTC timestamp at second resolution, formatted once per second"""
+    return _utc_isoformat(int(time.time()))
 
 
-@dataclass  
-class ChainBalance:
-    """Chain balance data structure"""
-    chain_id: int
-    chain_name: str
-    tokens: List[TokenBalance]
-    total_value_usd: float
+# Default chain set, built once
+_DEFAULT_CHAINS: Tuple[int, ...] = tuple(CHAIN_MAPPING.keys())
 
 
 class CoinbaseConfig:
     """Coinbase CDP API configuration"""
     
-    # Supported chains mapping (CDP SDK format)
-    CHAIN_MAPPING = {
-        1: "ethereum",
-        137: "polygon",
-        42161: "arbitrum",
-        10: "optimism", 
-        8453: "base"
-    }
+    CHAIN_MAPPING = CHAIN_MAPPING
+    CHAIN_INFO = CHAIN_INFO
     
-    CHAIN_INFO = {
-        "ethereum": {"chain_id": 1, "name": "Ethereum", "native_token": "ETH"},
-        "polygon": {"chain_id": 137, "name": "Polygon", "native_token": "MATIC"},
-        "arbitrum": {"chain_id": 42161, "name": "Arbitrum", "native_token": "ETH"},
-        "optimism": {"chain_id": 10, "name": "Optimism", "native_token": "ETH"},
-        "base": {"chain_id": 8453, "name": "Base", "native_token": "ETH"}
-    }
+    # Client-side CDP rate limit: burst size and sustained requests per second
+    RATE_LIMIT_BURST = 10
+    RATE_LIMIT_PER_SECOND = 5
+    
+    # Background CDP liveness probe interval and per-probe timeout (seconds);
+    # probes run in every worker, so the interval is kept long
+    LIVENESS_INTERVAL = 60.0
+    LIVENESS_TIMEOUT = 2.0
 
 
 class DeFiGuardCoinbaseService:
@@ -87,37 +123,53 @@ class DeFiGuardCoinbaseService:
         self.redis_url = redis_url
         self.redis_client = None
         self.cdp_client = None
+        self._cdp_bucket = AsyncTokenBucket(
+            capacity=CoinbaseConfig.RATE_LIMIT_BURST,
+            refill_rate=CoinbaseConfig.RATE_LIMIT_PER_SECOND
+        )
+        self._init_lock = asyncio.Lock()
+        self._cdp_live: Optional[bool] = None
+        self._cdp_live_at = 0.0
+        self._cdp_liveness_task: Optional[asyncio.Task] = None
         self._initialized = False
         
     async def initialize(self):
         """Initialize async components"""
         if self._initialized:
             return
+        
+        # Concurrent first requests wait here instead of each building clients
+        async with self._init_lock:
+            if self._initialized:
+                return
             
-        try:
-            # Set CDP environment variables
-            os.environ["CDP_API_KEY_ID"] = self.api_key_id
-            os.environ["CDP_API_KEY_SECRET"] = self.api_key_secret
-            
-            # Initialize Redis
-            self.redis_client = redis.from_url(self.redis_url)
-            
-            # Initialize CDP client
-            self.cdp_client = CdpClient()
-            
-            self._initialized = True
-            logger.info("✅ DeFiGuard Coinbase service initialized successfully")
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to initialize Coinbase service: {e}")
-            raise
+            try:
+                # Initialize Redis
+                self.redis_client = redis.Redis(connection_pool=_get_redis_pool(self.redis_url))
+                
+                # Initialize CDP client with this instance's credentials
+                self.cdp_client = CdpClient(
+                    api_key_id=self.api_key_id,
+                    api_key_secret=self.api_key_secret
+                )
+                self._cdp_liveness_task = asyncio.create_task(self._cdp_liveness_loop())
+                
+                self._initialized = True
+                logger.info("✅ DeFiGuard Coinbase service initialized successfully")
+                
+            except Exception as e:
+                logger.error("❌ Failed to initialize Coinbase service: {}", e)
+                raise
     
     async def close(self):
         """Clean up resources"""
+        if self._cdp_liveness_task:
+            self._cdp_liveness_task.cancel()
         if self.cdp_client:
             await self.cdp_client.close()
         if self.redis_client:
-            await self.redis_client.close()
+            # Releases this client only; the shared pool stays open for other instances
+            await self.redis_client.aclose()
         logger.info("🔒 Coinbase service resources cleaned up")
     
     async def get_cached_data(self, cache_key: str) -> Optional[Any]:
@@ -128,9 +180,9 @@ class DeFiGuardCoinbaseService:
                 
             cached = await self.redis_client.get(cache_key)
             if cached:
-                return json.loads(cached)
+                return orjson.loads(cached)
         except Exception as e:
-            logger.warning(f"Cache read error: {e}")
+            logger.warning("Cache read error: {}", e)
         return None
     
     async def cache_data(self, cache_key: str, data: Any, ttl: int = 300):
@@ -140,12 +192,73 @@ class DeFiGuardCoinbaseService:
                 await self.redis_client.setex(
                     cache_key,
                     ttl,
-                    json.dumps(data, default=str)
+                    orjson.dumps(data, default=str, option=_ORJSON_OPTS)
                 )
         except Exception as e:
-            logger.warning(f"Cache write error: {e}")
+            logger.warning("Cache write error: {}", e)
     
-    async def get_portfolio_balances(self, address: str, chains: List[int] = None) -> List[ChainBalance]:
+    async def get_cached_many(self, cache_keys: Sequence[str]) -> Dict[str, Any]:
+        """Get several cached values from Redis with a single MGET"""
+        try:
+            if not self.redis_client or not cache_keys:
+                return {}
+            
+            cached_values = await self.redis_client.mget(cache_keys)
+            return {
+                cache_key: orjson.loads(cached)
+                for cache_key, cached in zip(cache_keys, cached_values)
+                if cached
+            }
+        except Exception as e:
+            logger.warning("Cache read error: {}", e)
+        return {}
+    
+    async def cache_many(self, items: Dict[str, Any], ttl: int = 300):
+        """Cache several values in Redis with a shared TTL in a single pipelined round-trip"""
+        try:
+            if self.redis_client and items:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for cache_key, data in items.items():
+                        pipe.setex(cache_key, ttl, orjson.dumps(data, default=str, option=_ORJSON_OPTS))
+                    await pipe.execute()
+        except Exception as e:
+            logger.warning("Cache write error: {}", e)
+    
+    async def get_cached_chains(self, cache_key: str, chain_ids: Sequence[int]) -> Dict[int, ChainBalance]:
+        """Read the requested chains from a portfolio hash with a single HMGET"""
+        try:
+            if not self.redis_client or not chain_ids:
+                return {}
+            
+            cached_values = await self.redis_client.hmget(cache_key, [str(chain_id) for chain_id in chain_ids])
+            cached_chains = {}
+            for chain_id, cached in zip(chain_ids, cached_values):
+                if cached:
+                    cb = orjson.loads(cached)
+                    cached_chains[chain_id] = ChainBalance(**{**cb, "tokens": [TokenBalance(**t) for t in cb["tokens"]]})
+            return cached_chains
+        except Exception as e:
+            logger.warning("Cache read error: {}", e)
+        return {}
+    
+    async def cache_chains(self, cache_key: str, chain_balances: Iterable[ChainBalance], ttl: int = 300):
+        """Store chain balances as fields of a portfolio hash and refresh its TTL"""
+        try:
+            if self.redis_client:
+                mapping = {str(cb.chain_id): orjson.dumps(cb, option=_ORJSON_OPTS) for cb in chain_balances}
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.hset(cache_key, mapping=mapping)
+                    pipe.expire(cache_key, ttl)
+                    await pipe.execute()
+        except Exception as e:
+            logger.warning("Cache write error: {}", e)
+    
+    @staticmethod
+    def _price_cache_key(symbol: str, address: Optional[str] = None) -> str:
+        """Redis key for a cached token price"""
+        return f"defiguard:price:{symbol}:{address or 'native'}"
+    
+    async def get_portfolio_balances(self, address: str, chains: Optional[Sequence[int]] = None) -> List[ChainBalance]:
         """
         Get portfolio balances across multiple chains
         
@@ -160,79 +273,89 @@ class DeFiGuardCoinbaseService:
             await self.initialize()
             
         if chains is None:
-            chains = list(CoinbaseConfig.CHAIN_MAPPING.keys())
-            
-        # Check cache
-        cache_key = f"defiguard:balances:{address}:{'-'.join(map(str, chains))}"
-        cached_data = await self.get_cached_data(cache_key)
+            chains = _DEFAULT_CHAINS
         
-        if cached_data:
-            logger.info(f"📦 Using cached portfolio data for {address}")
-            return [ChainBalance(**cb) for cb in cached_data]
+        # Resolve network names in one pass; unsupported IDs are logged and dropped
+        chain_mapping = CHAIN_MAPPING
+        valid_chains = []
+        for chain_id in chains:
+            network_name = chain_mapping.get(chain_id)
+            if network_name is None:
+                logger.warning("Unsupported chain ID: {}", chain_id)
+                continue
+            valid_chains.append((chain_id, network_name))
         
-        logger.info(f"🔍 Fetching fresh portfolio data for {address}")
-        chain_balances = []
+        # Check cache; only chains missing from the per-address hash are fetched
+        cache_key = f"defiguard:balances:{address}"
+        cached_chains = await self.get_cached_chains(cache_key, [chain_id for chain_id, _ in valid_chains])
+        missing_chains = [(chain_id, network_name) for chain_id, network_name in valid_chains if chain_id not in cached_chains]
         
-        for chain_id in chains:
-            try:
-                network_name = CoinbaseConfig.CHAIN_MAPPING.get(chain_id)
-                if not network_name:
-                    logger.warning(f"Unsupported chain ID: {chain_id}")
-                    continue
-                    
-                chain_info = CoinbaseConfig.CHAIN_INFO[network_name]
-                logger.info(f"  🌐 Fetching from {chain_info['name']} (Chain {chain_id})")
-                
-                # For now, create demo data structure
-                # In production, this would use the actual CDP API calls
-                chain_balance = ChainBalance(
-                    chain_id=chain_id,
-                    chain_name=chain_info['name'],
-                    tokens=await self._fetch_chain_tokens(address, network_name),
-                    total_value_usd=0.0
-                )
-                
-                # Calculate total value
-                chain_balance.total_value_usd = sum(token.value_usd for token in chain_balance.tokens)
-                chain_balances.append(chain_balance)
-                
-                logger.info(f"  ✅ {chain_info['name']}: {len(chain_balance.tokens)} tokens, ${chain_balance.total_value_usd:.2f}")
-                
-            except Exception as e:
-                logger.error(f"  ❌ Error fetching from chain {chain_id}: {e}")
+        if cached_chains:
+            logger.info("📦 Using cached data for {}/{} chains of {}", len(cached_chains), len(valid_chains), address)
+        if missing_chains:
+            logger.info("🔍 Fetching fresh portfolio data for {}", address)
+        
+        # Fetch every missing chain concurrently; a failing chain is logged and skipped
+        # For now, create demo data structure
+        # In production, this would use the actual CDP API calls
+        results = await asyncio.gather(
+            *(self._fetch_chain_tokens(address, network_name) for _, network_name in missing_chains),
+            return_exceptions=True
+        )
+        
+        fetched_chains = {}
+        chain_info_by_network = CHAIN_INFO
+        for (chain_id, network_name), result in zip(missing_chains, results):
+            if isinstance(result, Exception):
+                logger.error("  ❌ Error fetching from chain {}: {}", chain_id, result)
                 continue
+            
+            tokens, total_value_usd = result
+            chain_info = chain_info_by_network[network_name]
+            chain_balance = ChainBalance(
+                chain_id=chain_id,
+                chain_name=chain_info['name'],
+                tokens=tokens,
+                total_value_usd=total_value_usd
+            )
+            fetched_chains[chain_id] = chain_balance
+            
+            logger.info("  ✅ {} (Chain {}): {} tokens, ${:.2f}", chain_info['name'], chain_id, len(chain_balance.tokens), chain_balance.total_value_usd)
         
         # Cache results
-        if chain_balances:
-            cache_data = [
-                {
-                    "chain_id": cb.chain_id,
-                    "chain_name": cb.chain_name,
-                    "tokens": [
-                        {
-                            "address": t.address,
-                            "symbol": t.symbol,
-                            "name": t.name,
-                            "balance": t.balance,
-                            "decimals": t.decimals,
-                            "price_usd": t.price_usd,
-                            "value_usd": t.value_usd,
-                            "logo_url": t.logo_url
-                        } for t in cb.tokens
-                    ],
-                    "total_value_usd": cb.total_value_usd
-                }
-                for cb in chain_balances
-            ]
-            await self.cache_data(cache_key, cache_data, ttl=30)  # 30 second cache
+        if fetched_chains:
+            await self.cache_chains(cache_key, fetched_chains.values(), ttl=30)  # 30 second cache
+            
+            # Balances carry current prices, so warm the price cache in the same
+            # pass: under the per-address key get_token_price reads and the
+            # symbol-only key get_token_prices reads
+            priced_tokens = [t for cb in fetched_chains.values() for t in cb.tokens if t.price_usd > 0]
+            warm_prices = {self._price_cache_key(t.symbol): {"price": t.price_usd} for t in priced_tokens}
+            warm_prices.update(
+                (self._price_cache_key(t.symbol, t.address), {"price": t.price_usd}) for t in priced_tokens
+            )
+            await self.cache_many(warm_prices, ttl=60)
+        
+        # Keep the requested chain order across cached and fetched entries
+        chain_balances = []
+        for chain_id, _ in valid_chains:
+            chain_balance = cached_chains.get(chain_id) or fetched_chains.get(chain_id)
+            if chain_balance is not None:
+                chain_balances.append(chain_balance)
         
-        total_value = sum(cb.total_value_usd for cb in chain_balances)
-        logger.info(f"🎯 Portfolio summary: {len(chain_balances)} chains, total value: ${total_value:.2f}")
+        # The total is only needed for this line, so compute it only if INFO is emitted
+        logger.opt(lazy=True).info(
+            "🎯 Portfolio summary: {} chains, total value: ${:.2f}",
+            lambda: len(chain_balances),
+            lambda: sum_usd(cb.total_value_usd for cb in chain_balances)
+        )
         
         return chain_balances
     
-    async def _fetch_chain_tokens(self, address: str, network: str) -> List[TokenBalance]:
-        """Fetch token balances for a specific chain"""
+    async def _fetch_chain_tokens(self, address: str, network: str) -> Tuple[List[TokenBalance], float]:
+        """Fetch token balances for a specific chain along with their total USD value"""
+        await self._cdp_bucket.acquire()
+        
         try:
             # This is where we would integrate with the actual CDP API
             # For hackathon demo, returning sample data structure
@@ -240,53 +363,95 @@ class DeFiGuardCoinbaseService:
             # In production, this would look like:
             # async with self.cdp_client as cdp:
             #     account = await cdp.evm.get_account(address=address)
-            #     balances = await account.get_balances(network=network)
-            #     return self._process_balances(balances)
+            #     raw_balances = await account.get_balances(network=network)
             
-            # Sample demo tokens for different networks
-            demo_tokens = {
+            # Sample demo balance rows for different networks, in the raw CDP
+            # shape: integer on-chain amount, token decimals and USD price
+            demo_balances = {
                 "ethereum": [
-                    TokenBalance(
-                        address="0xA0b86a33E6441dE61DDbE1a4B4C2d1aF9fCa7F",
-                        symbol="ETH",
-                        name="Ethereum",
-                        balance="1.5",
-                        decimals=18,
-                        price_usd=2500.0,
-                        value_usd=3750.0
-                    ),
-                    TokenBalance(
-                        address="0xA0b86a33E6441dE61DDbE1a4B4C2d1aF9fCa7F",
-                        symbol="USDC",
-                        name="USD Coin", 
-                        balance="1000.0",
-                        decimals=6,
-                        price_usd=1.0,
-                        value_usd=1000.0
-                    )
+                    {
+                        "address": "0xA0b86a33E6441dE61DDbE1a4B4C2d1aF9fCa7F",
+                        "symbol": "ETH",
+                        "name": "Ethereum",
+                        "amount": "1500000000000000000",
+                        "decimals": 18,
+                        "price_usd": 2500.0
+                    },
+                    {
+                        "address": "0xA0b86a33E6441dE61DDbE1a4B4C2d1aF9fCa7F",
+                        "symbol": "USDC",
+                        "name": "USD Coin",
+                        "amount": "1000000000",
+                        "decimals": 6,
+                        "price_usd": 1.0
+                    }
                 ],
                 "base": [
-                    TokenBalance(
-                        address="0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
-                        symbol="USDC",
-                        name="USD Coin",
-                        balance="500.0",
-                        decimals=6,
-                        price_usd=1.0,
-                        value_usd=500.0
-                    )
+                    {
+                        "address": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
+                        "symbol": "USDC",
+                        "name": "USD Coin",
+                        "amount": "500000000",
+                        "decimals": 6,
+                        "price_usd": 1.0
+                    }
                 ]
             }
             
-            return demo_tokens.get(network, [])
+            # Value all rows in one vectorized pass; the chain total is summed
+            # in micro-USD
+            batch = self._process_balances(demo_balances.get(network, ()))
+            return batch.to_aos(), batch.total_value_usd
             
         except Exception as e:
-            logger.error(f"Error fetching tokens from {network}: {e}")
-            return []
+            logger.error("Error fetching tokens from {}: {}", network, e)
+            return [], 0.0
+    
+    @staticmethod
+    def _process_balances(raw_balances: Sequence[Dict[str, Any]]) -> TokenBalanceBatch:
+        """
+        Convert raw CDP balance rows into a column-oriented token batch
+        
+        Rows carry the integer on-chain amount, token decimals and USD price.
+        USD values for all rows are computed in one vectorized pass; balance
+        strings are scaled exactly with Decimal.
+        """
+        amounts = np.array([float(row["amount"]) for row in raw_balances], dtype=np.float64)
+        decimals = np.array([row["decimals"] for row in raw_balances], dtype=np.int32)
+        prices = np.array([row.get("price_usd") or 0.0 for row in raw_balances], dtype=np.float64)
+        
+        return TokenBalanceBatch(
+            addresses=[row["address"] for row in raw_balances],
+            symbols=[row["symbol"] for row in raw_balances],
+            names=[row["name"] for row in raw_balances],
+            balances=[
+                f"{Decimal(row['amount']).scaleb(-row['decimals']).normalize():f}"
+                for row in raw_balances
+            ],
+            decimals=decimals,
+            prices_usd=prices,
+            values_usd=amounts / np.power(10.0, decimals) * prices,
+            logo_urls=[row.get("logo_url") for row in raw_balances]
+        )
+    
+    async def _fetch_token_price(self, symbol: str) -> float:
+        """Fetch a token price from upstream, paced by the CDP rate limiter"""
+        await self._cdp_bucket.acquire()
+        
+        # In production, this would use CDP price APIs
+        # For demo, return sample prices
+        demo_prices = {
+            "ETH": 2500.0,
+            "USDC": 1.0,
+            "MATIC": 0.85,
+            "ARB": 0.95
+        }
+        
+        return demo_prices.get(symbol, 0.0)
     
     async def get_token_price(self, symbol: str, address: str = None) -> Optional[float]:
         """Get current token price in USD"""
-        cache_key = f"defiguard:price:{symbol}:{address or 'native'}"
+        cache_key = self._price_cache_key(symbol, address)
         
         # Check cache
         cached_price = await self.get_cached_data(cache_key)
@@ -294,29 +459,89 @@ class DeFiGuardCoinbaseService:
             return cached_price.get("price")
         
         try:
-            # In production, this would use CDP price APIs
-            # For demo, return sample prices
-            demo_prices = {
-                "ETH": 2500.0,
-                "USDC": 1.0,
-                "MATIC": 0.85,
-                "ARB": 0.95
-            }
-            
-            price = demo_prices.get(symbol, 0.0)
+            price = await self._fetch_token_price(symbol)
             
             if price > 0:
                 await self.cache_data(cache_key, {"price": price}, ttl=60)
+            else:
+                # Remember unknown symbols briefly so they don't keep hitting upstream
+                await self.cache_data(cache_key, {"price": 0.0, "miss": True}, ttl=15)
             
             return price
             
         except Exception as e:
-            logger.error(f"Error fetching price for {symbol}: {e}")
+            logger.error("Error fetching price for {}: {}", symbol, e)
             return None
     
-    async def get_supported_chains(self) -> Dict[int, str]:
+    async def get_token_prices(self, symbols: Sequence[str]) -> Dict[str, float]:
+        """
+        Get current USD prices for several native tokens
+        
+        Cached prices are read with one MGET; misses are fetched concurrently
+        and written back in one pipeline. Unknown symbols are cached as 0.0
+        for a shorter TTL; symbols whose fetch fails are omitted.
+        """
+        cache_keys = {symbol: self._price_cache_key(symbol) for symbol in symbols}
+        cached_prices = await self.get_cached_many(list(cache_keys.values()))
+        
+        prices = {}
+        misses = []
+        for symbol, cache_key in cache_keys.items():
+            cached_price = cached_prices.get(cache_key)
+            if cached_price:
+                prices[symbol] = cached_price.get("price")
+            else:
+                misses.append(symbol)
+        
+        if misses:
+            fetched = await asyncio.gather(
+                *(self._fetch_token_price(symbol) for symbol in misses),
+                return_exceptions=True
+            )
+            
+            new_prices = {}
+            unknown_symbols = {}
+            for symbol, price in zip(misses, fetched):
+                if isinstance(price, Exception):
+                    logger.error("Error fetching price for {}: {}", symbol, price)
+                    continue
+                prices[symbol] = price
+                if price > 0:
+                    new_prices[cache_keys[symbol]] = {"price": price}
+                else:
+                    unknown_symbols[cache_keys[symbol]] = {"price": 0.0, "miss": True}
+            
+            await self.cache_many(new_prices, ttl=60)
+            await self.cache_many(unknown_symbols, ttl=15)
+        
+        return prices
+    
+    async def get_supported_chains(self) -> Mapping[int, str]:
         """Get supported blockchain networks"""
-        return CoinbaseConfig.CHAIN_MAPPING
+        return CHAIN_MAPPING
+    
+    async def _cdp_liveness_loop(self):
+        """
+        Probe CDP periodically so health checks can read a cached liveness flag
+        
+        Probes bypass _cdp_bucket: that budget is reserved for balance fetches.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.cdp_client.evm.list_accounts(page_size=1),
+                    timeout=CoinbaseConfig.LIVENESS_TIMEOUT
+                )
+                self._cdp_live = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._cdp_live is not False:
+                    logger.warning("CDP liveness probe failed: {}", e)
+                self._cdp_live = False
+            
+            self._cdp_live_at = time.monotonic()
+            await asyncio.sleep(CoinbaseConfig.LIVENESS_INTERVAL)
     
     async def health_check(self) -> Dict[str, Any]:
         """Check service health"""
@@ -324,14 +549,23 @@ class DeFiGuardCoinbaseService:
             await self.initialize()
             
         try:
-            # Test CDP connection
-            cdp_status = "healthy" if self.cdp_client else "unavailable"
+            # CDP status comes from the background liveness probe, not a per-call request
+            if not self.cdp_client:
+                cdp_status = "unavailable"
+            elif self._cdp_live is None:
+                cdp_status = "starting"
+            elif time.monotonic() - self._cdp_live_at > 3 * CoinbaseConfig.LIVENESS_INTERVAL:
+                cdp_status = "stale"
+            else:
+                cdp_status = "healthy" if self._cdp_live else "unreachable"
             
             # Test Redis connection
             redis_status = "healthy"
             try:
                 if self.redis_client:
-                    await self.redis_client.ping()
+                    await asyncio.wait_for(self.redis_client.ping(), timeout=0.5)
+            except asyncio.TimeoutError:
+                redis_status = "timeout"
             except:
                 redis_status = "unavailable"
             
@@ -342,17 +576,17 @@ class DeFiGuardCoinbaseService:
                     "cdp_api": cdp_status,
                     "redis_cache": redis_status
                 },
-                "supported_chains": len(CoinbaseConfig.CHAIN_MAPPING),
-                "timestamp": datetime.now(timezone.utc).isoformat()
+                "supported_chains": SUPPORTED_NETWORK_COUNT,
+                "timestamp": _utc_now_isoformat()
             }
             
         except Exception as e:
-            logger.error(f"Health check failed: {e}")
+            logger.error("Health check failed: {}", e)
             return {
                 "service": "DeFiGuard Coinbase CDP",
                 "status": "unhealthy",
                 "error": str(e),
-                "timestamp": datetime.now(timezone.utc).isoformat()
+                "timestamp": _utc_now_isoformat()
             }
 
 
@@ -4,18 +4,95 @@ Historical data retrieval for quantitative analysis and risk assessment
 """
 
 import asyncio
-import json
-from typing import Dict, List, Optional, Any, Tuple
-from datetime import datetime, timedelta, timezone
-from dataclasses import dataclass
+import functools
+import hashlib
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Literal, Optional, Set, Tuple, get_args
+from datetime import datetime, timezone
+from dataclasses import dataclass, field
 
 import aiohttp
+import numpy as np
+import orjson
 import redis.asyncio as redis
+import zstandard
 from loguru import logger
 from pydantic import BaseModel
 
+from services.rate_limit import AsyncTokenBucket
 
-@dataclass
+
+# Cache encoding: datetimes and numpy values are serialized natively by orjson
+_ORJSON_OPTS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+
+# Subgraphs with a configured endpoint (kept in sync with SUBGRAPH_ENDPOINTS)
+SubgraphName = Literal["uniswap_v3", "uniswap_v2", "aave_v3", "compound_v2", "balancer_v2"]
+
+# Compressed cache entries carry this prefix; anything else is read as plain JSON
+_ZSTD_PREFIX = b"zstd:"
+_ZSTD_COMPRESSOR = zstandard.ZstdCompressor(level=3)
+_ZSTD_DECOMPRESSOR = zstandard.ZstdDecompressor()
+
+
+def _pack_json(data: Any) -> bytes:
+    """Serialize a cache value to zstd-compressed JSON"""
+    return _ZSTD_PREFIX + _ZSTD_COMPRESSOR.compress(orjson.dumps(data, option=_ORJSON_OPTS))
+
+
+def _unpack_json(blob: bytes) -> Any:
+    """Decode a cache value written by _pack_json or as plain JSON"""
+    if blob.startswith(_ZSTD_PREFIX):
+        blob = _ZSTD_DECOMPRESSOR.decompress(blob[len(_ZSTD_PREFIX):])
+    return orjson.loads(blob)
+
+
+# Fields selected for each token in a history query (only the fields we read)
+_TOKEN_HISTORY_FIELDS = (
+    "symbol name "
+    "tokenDayData(first: $days, orderBy: date, orderDirection: desc, "
+    "where: {date_gte: $start, date_lte: $end}) { date priceUSD volumeUSD }"
+)
+
+
+def _jittered_ttl(ttl: int) -> int:
+    """Spread expiries of entries written together across +/- ttl/12"""
+    return ttl + random.randint(-(ttl // 12), ttl // 12)
+
+
+@functools.lru_cache(maxsize=256)
+def _query_hash(query: str) -> str:
+    """SHA-256 hex digest identifying a query for automatic persisted queries"""
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+# Error codes (or message fragments) a gateway answers a hash-only request
+# with: the hash is unknown, or persisted queries are not available at all
+_APQ_NOT_FOUND = ("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+_APQ_NOT_SUPPORTED = (
+    "PersistedQueryNotSupported", "PERSISTED_QUERY_NOT_SUPPORTED", "must provide query string"
+)
+
+
+def _persisted_query_error(result: "GraphQueryResult", markers: Tuple[str, ...]) -> bool:
+    """Whether a hash-only request's errors carry one of the given codes or messages"""
+    for error in result.errors or ():
+        code = str((error.get("extensions") or {}).get("code", ""))
+        message = str(error.get("message", ""))
+        if any(marker in code or marker in message for marker in markers):
+            return True
+    return False
+
+
+@functools.lru_cache(maxsize=None)
+def _token_history_query(batch_size: int) -> str:
+    """Prepared aliased history query taking token ids $t0..$t{n-1} as variables"""
+    token_vars = "".join(f", $t{i}: ID!" for i in range(batch_size))
+    selections = " ".join(f"t{i}: token(id: $t{i}) {{ {_TOKEN_HISTORY_FIELDS} }}" for i in range(batch_size))
+    return f"query TokenHistory($days: Int!, $start: Int!, $end: Int!{token_vars}) {{ {selections} }}"
+
+
+@dataclass(slots=True, frozen=True)
 class PricePoint:
     """Historical price data point"""
     timestamp: datetime
@@ -24,14 +101,42 @@ class PricePoint:
     market_cap: Optional[float] = None
 
 
-@dataclass
+# Row layout of the tokenDayData columns parsed from a subgraph response
+_HISTORY_DTYPE = np.dtype([("t", np.int64), ("p", np.float64), ("v", np.float64)])
+
+
+# eq=False: field-wise comparison is ill-defined for the ndarray columns
+@dataclass(slots=True, frozen=True, eq=False)
 class TokenHistoricalData:
-    """Historical data for a token"""
+    """
+    Historical data for a token
+    
+    Prices are held as aligned NumPy columns (unix seconds, USD price, USD
+    volume with NaN for unknown); PricePoint objects are only built on demand.
+    """
     token_address: str
     symbol: str
     name: str
-    price_history: List[PricePoint]
     period_days: int
+    timestamps: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    prices: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float64))
+    volumes: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float64))
+    fetched_at: float = field(default_factory=time.time)
+    
+    def __len__(self) -> int:
+        return len(self.timestamps)
+    
+    @property
+    def price_history(self) -> List[PricePoint]:
+        """Price history as PricePoint objects, oldest first"""
+        return [
+            PricePoint(
+                timestamp=datetime.fromtimestamp(ts, tz=timezone.utc),
+                price_usd=price,
+                volume_24h=None if volume != volume else volume
+            )
+            for ts, price, volume in zip(self.timestamps.tolist(), self.prices.tolist(), self.volumes.tolist())
+        ]
 
 
 class GraphQueryResult(BaseModel):
@@ -59,6 +164,62 @@ class DeFiGuardGraphService:
         "compound_v2": "https://gateway-arbitrum.network.thegraph.com/api/{api_key}/subgraphs/id/GRgmmsU8UgHxHs4oL5nF8L2wTbzDLK5mNiE6GwfFJvZk",
         "balancer_v2": "https://gateway-arbitrum.network.thegraph.com/api/{api_key}/subgraphs/id/C4ayEZP2yTXRAB8vSaTrgN4m9anTe9Mdm2ViyiAuV9TV"
     }
+    SUBGRAPH_NAMES: FrozenSet[str] = frozenset(SUBGRAPH_ENDPOINTS)
+    
+    # Protocol-specific queries
+    PROTOCOL_QUERIES = {
+        "uniswap": """
+        {
+            uniswapDayDatas(first: 7, orderBy: date, orderDirection: desc) {
+                date
+                volumeUSD
+                tvlUSD
+                feesUSD
+                txCount
+            }
+        }
+        """,
+        "aave": """
+        {
+            reserves(first: 10, orderBy: totalLiquidity, orderDirection: desc) {
+                symbol
+                name
+                totalLiquidity
+                availableLiquidity
+                totalBorrows
+                liquidityRate
+                variableBorrowRate
+            }
+        }
+        """
+    }
+    
+    # Subgraph backing each protocol query
+    PROTOCOL_SUBGRAPHS: Dict[str, SubgraphName] = {
+        "uniswap": "uniswap_v3",
+        "aave": "aave_v3"
+    }
+    
+    # Health probe request body, serialized once
+    _HEALTH_PAYLOAD = orjson.dumps({"query": "{ _meta { block { number hash } } }"})
+    
+    # Price histories live for an hour in Redis but are refreshed in the
+    # background once a cached copy is older than HISTORY_REFRESH_AFTER
+    HISTORY_CACHE_TTL = 3600
+    HISTORY_REFRESH_AFTER = 0.8 * HISTORY_CACHE_TTL
+    
+    # Concurrent subgraph requests and client-side pacing toward the gateway
+    MAX_CONCURRENT_QUERIES = 64
+    RATE_LIMIT_BURST = 100
+    RATE_LIMIT_PER_SECOND = 100
+    
+    # Retries for rate-limited (HTTP 429) queries, with exponential backoff
+    # when the gateway sends no Retry-After
+    MAX_RETRIES = 3
+    RETRY_BASE_DELAY = 0.5
+    
+    # Tokens per aliased history query, kept under subgraph query complexity limits
+    BATCH_QUERY_SIZE = 20
     
     def __init__(self, api_key: str, redis_url: str):
         self.api_key = api_key
@@ -67,6 +228,21 @@ class DeFiGuardGraphService:
         self.session = None
         self._initialized = False
         
+        # Fetches in progress keyed by cache key, so identical concurrent
+        # requests share one subgraph round-trip
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        
+        # (subgraph, query hash) pairs the gateway has registered, and the
+        # subgraphs that rejected hash-only requests
+        self._persisted_queries: Set[Tuple[str, str]] = set()
+        self._apq_unsupported: Set[str] = set()
+        
+        self._query_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_QUERIES)
+        self._rate_limiter = AsyncTokenBucket(
+            capacity=self.RATE_LIMIT_BURST,
+            refill_rate=self.RATE_LIMIT_PER_SECOND
+        )
+        
         # Format subgraph URLs with API key
         self.formatted_endpoints = {
             name: url.format(api_key=api_key) 
@@ -82,8 +258,17 @@ class DeFiGuardGraphService:
             # Initialize Redis
             self.redis_client = redis.from_url(self.redis_url)
             
-            # Initialize HTTP session
+            # Initialize HTTP session; every subgraph shares the gateway host, so one
+            # keepalive pool with cached DNS serves all endpoints
+            connector = aiohttp.TCPConnector(
+                limit=128,
+                limit_per_host=64,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+                enable_cleanup_closed=True
+            )
             self.session = aiohttp.ClientSession(
+                connector=connector,
                 timeout=aiohttp.ClientTimeout(total=30),
                 headers={
                     "Content-Type": "application/json",
@@ -99,11 +284,17 @@ class DeFiGuardGraphService:
             raise
     
     async def close(self):
-        """Clean up resources"""
+        """Finish in-flight fetches, then clean up resources"""
+        if self._in_flight:
+            await asyncio.gather(*set(self._in_flight.values()), return_exceptions=True)
         if self.session:
             await self.session.close()
+            self.session = None
         if self.redis_client:
-            await self.redis_client.close()
+            await self.redis_client.aclose()
+            self.redis_client = None
+        # The factory hands out this same instance again, so allow re-initialization
+        self._initialized = False
         logger.info("🔒 Graph service resources cleaned up")
     
     async def get_cached_data(self, cache_key: str) -> Optional[Any]:
@@ -114,7 +305,7 @@ class DeFiGuardGraphService:
                 
             cached = await self.redis_client.get(cache_key)
             if cached:
-                return json.loads(cached)
+                return _unpack_json(cached)
         except Exception as e:
             logger.warning(f"Cache read error: {e}")
         return None
@@ -125,51 +316,349 @@ class DeFiGuardGraphService:
             if self.redis_client:
                 await self.redis_client.setex(
                     cache_key,
-                    ttl,
-                    json.dumps(data, default=str)
+                    _jittered_ttl(ttl),
+                    _pack_json(data)
                 )
         except Exception as e:
             logger.warning(f"Cache write error: {e}")
     
-    async def query_subgraph(self, subgraph: str, query: str) -> GraphQueryResult:
+    async def get_cached_many(self, cache_keys: List[str]) -> Dict[str, Any]:
+        """Get several cached values from Redis with a single MGET"""
+        try:
+            if not self.redis_client or not cache_keys:
+                return {}
+            
+            cached_values = await self.redis_client.mget(cache_keys)
+            return {
+                cache_key: _unpack_json(cached)
+                for cache_key, cached in zip(cache_keys, cached_values)
+                if cached
+            }
+        except Exception as e:
+            logger.warning(f"Cache read error: {e}")
+        return {}
+    
+    async def cache_many(self, items: Dict[str, Any], ttl: int = 3600):
+        """Cache several values in Redis with a shared TTL in a single pipelined round-trip"""
+        try:
+            if self.redis_client and items:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for cache_key, data in items.items():
+                        pipe.setex(cache_key, _jittered_ttl(ttl), _pack_json(data))
+                    await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Cache write error: {e}")
+    
+    @staticmethod
+    def _decode_history(cached: Dict[bytes, bytes]) -> TokenHistoricalData:
+        """Rebuild price history from its packed NumPy columns"""
+        meta = orjson.loads(cached[b"meta"])
+        
+        return TokenHistoricalData(
+            token_address=meta["token_address"],
+            symbol=meta["symbol"],
+            name=meta["name"],
+            period_days=meta["period_days"],
+            # Entries written before fetched_at was recorded count as stale
+            fetched_at=meta.get("fetched_at", 0.0),
+            timestamps=np.frombuffer(cached[b"ts"], dtype=np.int64),
+            prices=np.frombuffer(cached[b"px"], dtype=np.float64),
+            volumes=np.frombuffer(cached[b"vol"], dtype=np.float64)
+        )
+    
+    @staticmethod
+    def _encode_history(data: TokenHistoricalData) -> Dict[str, bytes]:
+        """Pack price history into int64/float64 columns plus JSON metadata"""
+        return {
+            "ts": np.ascontiguousarray(data.timestamps, dtype=np.int64).tobytes(),
+            "px": np.ascontiguousarray(data.prices, dtype=np.float64).tobytes(),
+            "vol": np.ascontiguousarray(data.volumes, dtype=np.float64).tobytes(),
+            "meta": orjson.dumps({
+                "token_address": data.token_address,
+                "symbol": data.symbol,
+                "name": data.name,
+                "period_days": data.period_days,
+                "fetched_at": data.fetched_at
+            })
+        }
+    
+    async def get_cached_history(self, cache_key: str) -> Optional[TokenHistoricalData]:
+        """Get cached price history stored as packed NumPy columns in a Redis hash"""
+        return (await self.get_cached_histories([cache_key]))[0]
+    
+    async def get_cached_histories(self, cache_keys: List[str]) -> List[Optional[TokenHistoricalData]]:
+        """Get several cached price histories in a single pipelined round-trip"""
+        try:
+            if self.redis_client and cache_keys:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for cache_key in cache_keys:
+                        pipe.hgetall(cache_key)
+                    cached_values = await pipe.execute()
+                
+                return [self._decode_history(cached) if cached else None for cached in cached_values]
+        except Exception as e:
+            logger.warning(f"Cache read error: {e}")
+        return [None] * len(cache_keys)
+    
+    async def cache_history(self, cache_key: str, data: TokenHistoricalData, ttl: int = 3600):
+        """Cache price history as packed int64/float64 columns plus JSON metadata"""
+        await self.cache_histories({cache_key: data}, ttl)
+    
+    async def cache_histories(self, items: Dict[str, TokenHistoricalData], ttl: int = 3600):
+        """Cache several price histories in a single pipelined round-trip"""
+        try:
+            if self.redis_client and items:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for cache_key, data in items.items():
+                        pipe.hset(cache_key, mapping=self._encode_history(data))
+                        pipe.expire(cache_key, _jittered_ttl(ttl))
+                    await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Cache write error: {e}")
+    
+    async def query_subgraph(
+        self, 
+        subgraph: SubgraphName, 
+        query: str, 
+        variables: Optional[Dict[str, Any]] = None
+    ) -> GraphQueryResult:
         """
         Execute GraphQL query against a subgraph
         
         Args:
             subgraph: Name of the subgraph (e.g., 'uniswap_v3')
             query: GraphQL query string
+            variables: Values for the query's declared variables
             
         Returns:
             GraphQueryResult with data and potential errors
         """
+        payload: Dict[str, Any] = {}
+        if variables:
+            payload["variables"] = variables
+        
+        if subgraph in self._apq_unsupported:
+            payload["query"] = query
+            return await self.post_subgraph(subgraph, orjson.dumps(payload))
+        
+        # Automatic persisted queries: once the gateway has seen a query,
+        # send only its hash
+        query_hash = _query_hash(query)
+        payload["extensions"] = {"persistedQuery": {"version": 1, "sha256Hash": query_hash}}
+        persisted_key = (subgraph, query_hash)
+        
+        if persisted_key in self._persisted_queries:
+            # Transport and HTTP errors propagate and leave the APQ state alone;
+            # ordinary GraphQL errors are the caller's to handle
+            result = await self.post_subgraph(subgraph, orjson.dumps(payload))
+            if _persisted_query_error(result, _APQ_NOT_SUPPORTED):
+                self._apq_unsupported.add(subgraph)
+            elif not _persisted_query_error(result, _APQ_NOT_FOUND):
+                return result
+            
+            # Evicted by the gateway, or hash-only requests are not supported:
+            # resend with the full query
+            self._persisted_queries.discard(persisted_key)
+        
+        # Full query plus hash registers it for later hash-only requests
+        payload["query"] = query
+        result = await self.post_subgraph(subgraph, orjson.dumps(payload))
+        if not result.errors:
+            self._persisted_queries.add(persisted_key)
+        return result
+    
+    async def post_subgraph(self, subgraph: SubgraphName, payload: bytes) -> GraphQueryResult:
+        """
+        Execute a pre-serialized GraphQL request body against a subgraph
+        
+        Args:
+            subgraph: Name of the subgraph (e.g., 'uniswap_v3')
+            payload: JSON-encoded GraphQL request body
+            
+        Returns:
+            GraphQueryResult with data and potential errors
+        """
+        if subgraph not in self.SUBGRAPH_NAMES:
+            raise ValueError(f"Unknown subgraph: {subgraph}")
+        
         if not self._initialized:
             await self.initialize()
             
-        endpoint = self.formatted_endpoints.get(subgraph)
-        if not endpoint:
-            raise ValueError(f"Unknown subgraph: {subgraph}")
+        endpoint = self.formatted_endpoints[subgraph]
         
         try:
-            payload = {"query": query}
-            
-            async with self.session.post(endpoint, json=payload) as response:
-                result_data = await response.json()
-                
-                if response.status != 200:
-                    logger.error(f"Graph query failed: {response.status} - {result_data}")
-                    raise Exception(f"Graph API returned {response.status}")
-                
-                return GraphQueryResult(**result_data)
+            for attempt in range(self.MAX_RETRIES + 1):
+                async with self._query_semaphore:
+                    await self._rate_limiter.acquire()
+                    
+                    async with self.session.post(endpoint, data=payload) as response:
+                        if response.status == 429 and attempt < self.MAX_RETRIES:
+                            delay = self._retry_delay(response.headers.get("Retry-After"), attempt)
+                            logger.warning(f"Graph API rate limited, retrying in {delay:.1f}s")
+                            # Holds back every caller, not just this one
+                            self._rate_limiter.penalize(delay)
+                            continue
+                        
+                        if response.headers.get("X-RateLimit-Remaining") == "0":
+                            self._rate_limiter.penalize()
+                        
+                        result_data = orjson.loads(await response.read())
+                        
+                        if response.status != 200:
+                            logger.error(f"Graph query failed: {response.status} - {result_data}")
+                            raise Exception(f"Graph API returned {response.status}")
+                        
+                        return GraphQueryResult(
+                            data=result_data.get("data") or {},
+                            errors=result_data.get("errors")
+                        )
                 
         except Exception as e:
             logger.error(f"Error querying subgraph {subgraph}: {e}")
             raise
     
+    def _retry_delay(self, retry_after: Optional[str], attempt: int) -> float:
+        """Seconds to wait before retrying: the server's Retry-After, else exponential backoff"""
+        try:
+            return max(float(retry_after), 0.0)
+        except (TypeError, ValueError):
+            return self.RETRY_BASE_DELAY * 2 ** attempt
+    
+    def _release_in_flight(self, keys: List[str], future: asyncio.Future):
+        """Drop a finished fetch from the in-flight registry"""
+        for key in keys:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+    
+    async def _coalesce(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run factory() once per key at a time
+        
+        Concurrent callers with the same key await the first caller's task.
+        The task is shielded so one caller being cancelled does not cancel
+        the work the others are waiting on.
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._in_flight[key] = future
+            future.add_done_callback(functools.partial(self._release_in_flight, [key]))
+        return await asyncio.shield(future)
+    
+    @staticmethod
+    def _history_cache_key(token_address: str, days: int, subgraph: SubgraphName) -> str:
+        """Redis key for a token's cached price history"""
+        return f"defiguard:graph:history:{token_address}:{days}:{subgraph}"
+    
+    @staticmethod
+    def _parse_token_history(
+        token_address: str, 
+        token_data: Dict[str, Any], 
+        days: int,
+        fetched_at: float
+    ) -> TokenHistoricalData:
+        """Convert a subgraph token object into TokenHistoricalData"""
+        rows = []
+        for day_data in token_data.get("tokenDayData", []):
+            try:
+                rows.append((
+                    int(day_data["date"]),
+                    float(day_data.get("priceUSD", 0)),
+                    float(day_data.get("volumeUSD", 0))
+                ))
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Error processing day data: {e}")
+                continue
+        
+        # Subgraph returns newest first; store oldest first
+        history = np.array(rows, dtype=_HISTORY_DTYPE)
+        history.sort(order="t", kind="stable")
+        
+        return TokenHistoricalData(
+            token_address=token_address,
+            symbol=token_data.get("symbol", "UNKNOWN"),
+            name=token_data.get("name", "Unknown Token"),
+            period_days=days,
+            timestamps=np.ascontiguousarray(history["t"]),
+            prices=np.ascontiguousarray(history["p"]),
+            volumes=np.ascontiguousarray(history["v"]),
+            fetched_at=fetched_at
+        )
+    
+    async def _fetch_history_batch(
+        self, 
+        token_addresses: List[str], 
+        days: int,
+        subgraph: SubgraphName
+    ) -> Dict[str, TokenHistoricalData]:
+        """
+        Fetch price history for several tokens with one aliased GraphQL query
+        
+        Each token is selected as t{i}: token(id: $t{i}) so a single request
+        and query plan serves the whole batch. Found tokens are cached together.
+        """
+        # Calculate timestamp for query from a single clock read
+        now = time.time()
+        end_time = int(now)
+        start_time = end_time - days * 86400
+        
+        # Prepared query text depends only on the batch size; the tokens and
+        # time window travel as variables
+        query = _token_history_query(len(token_addresses))
+        variables = {
+            "days": days,
+            "start": start_time,
+            "end": end_time,
+            **{f"t{i}": token_address.lower() for i, token_address in enumerate(token_addresses)}
+        }
+        
+        try:
+            result = await self.query_subgraph(subgraph, query, variables)
+            
+            if result.errors:
+                logger.error(f"GraphQL errors: {result.errors}")
+            
+            histories = {}
+            found = {}
+            for i, token_address in enumerate(token_addresses):
+                token_data = result.data.get(f"t{i}")
+                if not token_data:
+                    logger.warning(f"No data found for token {token_address}")
+                    histories[token_address] = TokenHistoricalData(
+                        token_address=token_address,
+                        symbol="UNKNOWN",
+                        name="Unknown Token",
+                        period_days=days
+                    )
+                    continue
+                
+                historical_data = self._parse_token_history(token_address, token_data, days, now)
+                histories[token_address] = historical_data
+                found[self._history_cache_key(token_address, days, subgraph)] = historical_data
+                logger.info(f"✅ Retrieved {len(historical_data)} price points for {historical_data.symbol}")
+            
+            # Cache the results
+            await self.cache_histories(found, ttl=self.HISTORY_CACHE_TTL)
+            return histories
+            
+        except Exception as e:
+            logger.error(f"Error fetching price history for {', '.join(token_addresses)}: {e}")
+            # Return empty data structures on error
+            return {
+                token_address: TokenHistoricalData(
+                    token_address=token_address,
+                    symbol="ERROR",
+                    name="Error fetching data",
+                    period_days=days
+                )
+                for token_address in token_addresses
+            }
+    
     async def get_token_price_history(
         self, 
         token_address: str, 
         days: int = 90,
-        subgraph: str = "uniswap_v3"
+        subgraph: SubgraphName = "uniswap_v3"
     ) -> TokenHistoricalData:
         """
         Get historical price data for a token
@@ -182,160 +671,115 @@ class DeFiGuardGraphService:
         Returns:
             TokenHistoricalData with price history
         """
-        cache_key = f"defiguard:graph:prices:{token_address}:{days}:{subgraph}"
+        cache_key = self._history_cache_key(token_address, days, subgraph)
         
         # Check cache first
-        cached_data = await self.get_cached_data(cache_key)
-        if cached_data:
+        cached_history = await self.get_cached_history(cache_key)
+        if cached_history is not None:
             logger.info(f"📦 Using cached price history for {token_address}")
-            return TokenHistoricalData(**cached_data)
+            self._revalidate_stale([cached_history], days, subgraph)
+            return cached_history
         
         logger.info(f"🔍 Fetching {days} days of price history for {token_address}")
+        histories = await self._fetch_histories([token_address], days, subgraph)
+        return histories[token_address]
+    
+    async def _fetch_histories(
+        self, 
+        token_addresses: List[str], 
+        days: int,
+        subgraph: SubgraphName
+    ) -> Dict[str, TokenHistoricalData]:
+        """
+        Fetch uncached histories in batches, joining identical fetches already in flight
         
-        # Calculate timestamp for query
-        end_time = int(datetime.now(timezone.utc).timestamp())
-        start_time = int((datetime.now(timezone.utc) - timedelta(days=days)).timestamp())
-        
-        # GraphQL query for token price history
-        query = f"""
-        {{
-            token(id: "{token_address.lower()}") {{
-                id
-                symbol
-                name
-                decimals
-                tokenDayData(
-                    first: {days}
-                    orderBy: date
-                    orderDirection: desc
-                    where: {{
-                        date_gte: {start_time}
-                        date_lte: {end_time}
-                    }}
-                ) {{
-                    date
-                    priceUSD
-                    volume
-                    volumeUSD
-                    totalValueLocked
-                    totalValueLockedUSD
-                }}
-            }}
-        }}
+        Each batch task is registered under the cache key of every token it
+        covers, and resolves to the batch's address -> history mapping.
         """
+        pending = self._start_history_fetches(token_addresses, days, subgraph)
+        await asyncio.shield(asyncio.gather(*set(pending.values())))
+        return {address: task.result()[address] for address, task in pending.items()}
+    
+    def _start_history_fetches(
+        self, 
+        token_addresses: List[str], 
+        days: int,
+        subgraph: SubgraphName
+    ) -> Dict[str, asyncio.Future]:
+        """Start batch fetches for tokens not already in flight; returns each token's task"""
+        pending = {}
+        misses = []
+        for address in token_addresses:
+            task = self._in_flight.get(self._history_cache_key(address, days, subgraph))
+            if task is None:
+                misses.append(address)
+            else:
+                pending[address] = task
         
-        try:
-            result = await self.query_subgraph(subgraph, query)
-            
-            if result.errors:
-                logger.error(f"GraphQL errors: {result.errors}")
-            
-            token_data = result.data.get("token")
-            if not token_data:
-                logger.warning(f"No data found for token {token_address}")
-                return TokenHistoricalData(
-                    token_address=token_address,
-                    symbol="UNKNOWN",
-                    name="Unknown Token",
-                    price_history=[],
-                    period_days=days
-                )
-            
-            # Process price history
-            price_history = []
-            for day_data in token_data.get("tokenDayData", []):
-                try:
-                    timestamp = datetime.fromtimestamp(int(day_data["date"]), tz=timezone.utc)
-                    price_usd = float(day_data.get("priceUSD", 0))
-                    volume_24h = float(day_data.get("volumeUSD", 0))
-                    
-                    price_point = PricePoint(
-                        timestamp=timestamp,
-                        price_usd=price_usd,
-                        volume_24h=volume_24h
-                    )
-                    price_history.append(price_point)
-                    
-                except (ValueError, KeyError) as e:
-                    logger.warning(f"Error processing day data: {e}")
-                    continue
-            
-            # Create historical data object
-            historical_data = TokenHistoricalData(
-                token_address=token_address,
-                symbol=token_data.get("symbol", "UNKNOWN"),
-                name=token_data.get("name", "Unknown Token"),
-                price_history=sorted(price_history, key=lambda x: x.timestamp),
-                period_days=days
-            )
-            
-            # Cache the results
-            cache_data = {
-                "token_address": historical_data.token_address,
-                "symbol": historical_data.symbol,
-                "name": historical_data.name,
-                "price_history": [
-                    {
-                        "timestamp": p.timestamp.isoformat(),
-                        "price_usd": p.price_usd,
-                        "volume_24h": p.volume_24h,
-                        "market_cap": p.market_cap
-                    } for p in historical_data.price_history
-                ],
-                "period_days": historical_data.period_days
-            }
-            
-            await self.cache_data(cache_key, cache_data, ttl=3600)  # 1 hour cache
-            
-            logger.info(f"✅ Retrieved {len(price_history)} price points for {historical_data.symbol}")
-            return historical_data
-            
-        except Exception as e:
-            logger.error(f"Error fetching price history for {token_address}: {e}")
-            # Return empty data structure on error
-            return TokenHistoricalData(
-                token_address=token_address,
-                symbol="ERROR",
-                name="Error fetching data",
-                price_history=[],
-                period_days=days
-            )
+        batch_size = self.BATCH_QUERY_SIZE
+        for i in range(0, len(misses), batch_size):
+            batch = misses[i:i + batch_size]
+            keys = [self._history_cache_key(address, days, subgraph) for address in batch]
+            task = asyncio.ensure_future(self._fetch_history_batch(batch, days, subgraph))
+            for key, address in zip(keys, batch):
+                self._in_flight[key] = task
+                pending[address] = task
+            task.add_done_callback(functools.partial(self._release_in_flight, keys))
+        
+        return pending
+    
+    def _revalidate_stale(
+        self, 
+        histories: List[TokenHistoricalData], 
+        days: int,
+        subgraph: SubgraphName
+    ):
+        """Refresh cached histories nearing expiry in the background (stale-while-revalidate)"""
+        refresh_before = time.time() - self.HISTORY_REFRESH_AFTER
+        stale = [history.token_address for history in histories if history.fetched_at < refresh_before]
+        if stale:
+            logger.info(f"♻️ Refreshing {len(stale)} stale price histories in the background")
+            # The in-flight registry holds the task references until they finish
+            self._start_history_fetches(stale, days, subgraph)
     
     async def get_portfolio_historical_data(
         self, 
         token_addresses: List[str], 
-        days: int = 90
+        days: int = 90,
+        subgraph: SubgraphName = "uniswap_v3"
     ) -> List[TokenHistoricalData]:
         """
         Get historical data for multiple tokens (portfolio analysis)
         
+        Cached histories are read in one pipeline; the misses are fetched with
+        aliased multi-token queries of up to BATCH_QUERY_SIZE tokens each,
+        issued concurrently.
+        
         Args:
             token_addresses: List of token contract addresses
             days: Number of days of history
+            subgraph: Subgraph to query (default uniswap_v3)
             
         Returns:
             List of TokenHistoricalData objects
         """
         logger.info(f"🔍 Fetching historical data for {len(token_addresses)} tokens")
         
-        # Fetch data concurrently for all tokens
-        tasks = []
-        for address in token_addresses:
-            task = self.get_token_price_history(address, days)
-            tasks.append(task)
+        unique_addresses = list(dict.fromkeys(token_addresses))
+        cached_histories = await self.get_cached_histories(
+            [self._history_cache_key(address, days, subgraph) for address in unique_addresses]
+        )
+        histories = {
+            address: cached for address, cached in zip(unique_addresses, cached_histories) if cached is not None
+        }
         
-        # Wait for all requests to complete
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self._revalidate_stale(list(histories.values()), days, subgraph)
         
-        # Process results
-        historical_data = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                logger.error(f"Error fetching data for {token_addresses[i]}: {result}")
-                continue
-            
-            if isinstance(result, TokenHistoricalData):
-                historical_data.append(result)
+        misses = [address for address in unique_addresses if address not in histories]
+        if misses:
+            histories.update(await self._fetch_histories(misses, days, subgraph))
+        
+        historical_data = [histories[address] for address in token_addresses if address in histories]
         
         logger.info(f"✅ Successfully retrieved historical data for {len(historical_data)} tokens")
         return historical_data
@@ -350,82 +794,73 @@ class DeFiGuardGraphService:
         Returns:
             Protocol data dictionary
         """
-        cache_key = f"defiguard:graph:protocol:{protocol}"
-        
-        # Check cache
-        cached_data = await self.get_cached_data(cache_key)
-        if cached_data:
-            return cached_data
-        
-        # Protocol-specific queries
-        protocol_queries = {
-            "uniswap": """
-            {
-                uniswapDayDatas(first: 7, orderBy: date, orderDirection: desc) {
-                    date
-                    volumeUSD
-                    tvlUSD
-                    feesUSD
-                    txCount
-                }
-            }
-            """,
-            "aave": """
-            {
-                reserves(first: 10, orderBy: totalLiquidity, orderDirection: desc) {
-                    symbol
-                    name
-                    totalLiquidity
-                    availableLiquidity
-                    totalBorrows
-                    liquidityRate
-                    variableBorrowRate
-                }
-            }
-            """
-        }
-        
-        query = protocol_queries.get(protocol.lower())
+        return (await self.get_defi_protocols_data([protocol]))[protocol]
+    
+    async def _fetch_protocol_data(self, protocol: str) -> Dict[str, Any]:
+        """Query the subgraph backing a protocol, returning an error dict on failure"""
+        query = self.PROTOCOL_QUERIES.get(protocol.lower())
         if not query:
             return {"error": f"No query available for protocol: {protocol}"}
         
         try:
             # Determine which subgraph to use
-            subgraph_map = {
-                "uniswap": "uniswap_v3",
-                "aave": "aave_v3"
-            }
-            
-            subgraph = subgraph_map.get(protocol.lower(), "uniswap_v3")
+            subgraph = self.PROTOCOL_SUBGRAPHS.get(protocol.lower(), "uniswap_v3")
             result = await self.query_subgraph(subgraph, query)
-            
-            # Cache and return result
-            await self.cache_data(cache_key, result.data, ttl=1800)  # 30 min cache
             return result.data
             
         except Exception as e:
             logger.error(f"Error fetching protocol data for {protocol}: {e}")
             return {"error": str(e)}
     
+    async def get_defi_protocols_data(self, protocols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get data for several DeFi protocols
+        
+        Cached entries are read with one MGET; misses are queried concurrently
+        and written back in one pipeline.
+        
+        Args:
+            protocols: Protocol names (e.g., ['aave', 'uniswap'])
+            
+        Returns:
+            Protocol data dictionaries keyed by protocol name
+        """
+        cache_keys = {protocol: f"defiguard:graph:protocol:{protocol}" for protocol in protocols}
+        
+        # Check cache
+        cached = await self.get_cached_many(list(cache_keys.values()))
+        results = {
+            protocol: cached[cache_key] for protocol, cache_key in cache_keys.items() if cache_key in cached
+        }
+        
+        misses = [protocol for protocol in cache_keys if protocol not in results]
+        if misses:
+            fetched = await asyncio.gather(*(
+                self._coalesce(cache_keys[protocol], functools.partial(self._fetch_protocol_data, protocol))
+                for protocol in misses
+            ))
+            results.update(zip(misses, fetched))
+            
+            # Cache successful results
+            await self.cache_many(
+                {cache_keys[protocol]: data for protocol, data in zip(misses, fetched) if "error" not in data},
+                ttl=1800  # 30 min cache
+            )
+        
+        return results
+    
     async def health_check(self) -> Dict[str, Any]:
-        """Check service health"""
+        """Check service health, sharing one probe between concurrent callers"""
+        return await self._coalesce("defiguard:graph:health", self._check_health)
+    
+    async def _check_health(self) -> Dict[str, Any]:
+        """Probe the Graph API and Redis"""
         if not self._initialized:
             await self.initialize()
             
         try:
             # Test Graph API with simple query
-            test_query = """
-            {
-                _meta {
-                    block {
-                        number
-                        hash
-                    }
-                }
-            }
-            """
-            
-            result = await self.query_subgraph("uniswap_v3", test_query)
+            result = await self.post_subgraph("uniswap_v3", self._HEALTH_PAYLOAD)
             graph_status = "healthy" if result.data else "degraded"
             
             # Test Redis connection
@@ -457,7 +892,11 @@ class DeFiGuardGraphService:
             }
 
 
-# Service factory function
+assert DeFiGuardGraphService.SUBGRAPH_NAMES == frozenset(get_args(SubgraphName))
+
+
+# Service factory function; one instance (and connection pool) per configuration
+@functools.lru_cache(maxsize=4)
 def create_graph_service(api_key: str, redis_url: str) -> DeFiGuardGraphService:
     """Create and return configured Graph service instance"""
     return DeFiGuardGraphService(api_key, redis_url)
@@ -484,17 +923,20 @@ async def test_graph_service():
         
         print(f"Historical data for {historical_data.symbol}:")
         print(f"  Address: {historical_data.token_address}")
-        print(f"  Price points: {len(historical_data.price_history)}")
+        print(f"  Price points: {len(historical_data)}")
         print(f"  Period: {historical_data.period_days} days")
         
-        if historical_data.price_history:
-            latest = historical_data.price_history[-1]
-            print(f"  Latest price: ${latest.price_usd:.4f}")
-            print(f"  Latest volume: ${latest.volume_24h:.2f}")
+        if len(historical_data):
+            print(f"  Latest price: ${historical_data.prices[-1]:.4f}")
+            print(f"  Latest volume: ${historical_data.volumes[-1]:.2f}")
         
     finally:
         await service.close()
 
 
 if __name__ == "__main__":
+    import uvloop
+    
+    # libuv event loop for the aiohttp/Redis-bound workload
+    uvloop.install()
     asyncio.run(test_graph_service())
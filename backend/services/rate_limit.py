@@ -0,0 +1,42 @@
+"""
+Client-side rate limiting shared by the upstream API services
+"""
+
+import asyncio
+import time
+
+
+class AsyncTokenBucket:
+    """
+    Client-side token bucket for pacing upstream API calls
+    
+    Callers wait until a token is available instead of bursting into the
+    provider's rate limiter and backing off on 429s.
+    """
+    
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self, n: float = 1):
+        """Take n tokens, sleeping until enough have been refilled"""
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+                self.last_refill = now
+                
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                
+                wait = (n - self.tokens) / self.refill_rate
+            
+            await asyncio.sleep(wait)
+    
+    def penalize(self, delay: float = 0.0):
+        """Empty the bucket and hold off refills for delay seconds (e.g. a server's Retry-After)"""
+        self.tokens = min(self.tokens, 0) - delay * self.refill_rate
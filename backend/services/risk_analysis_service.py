@@ -1,34 +1,333 @@
 """
 Risk Analysis Service for DeFiGuard
-Implements sophisticated portfolio risk analysis using Riskfolio-Lib and PyPortfolioOpt
+Implements sophisticated portfolio risk analysis using PyPortfolioOpt and NumPy
 """
 
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 import pandas as pd
 import numpy as np
 import yfinance as yf
 from typing import Dict, List, Optional, Tuple, Any
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import diskcache
 import warnings
 warnings.filterwarnings('ignore')
 
 # Portfolio Optimization Libraries
-import riskfolio as rp
-from pypfopt import EfficientFrontier, risk_models, expected_returns
-from pypfopt.plotting import plot_covariance, plot_efficient_frontier
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.graph_objects as go
-import plotly.express as px
-from io import BytesIO
-import base64
+from pypfopt import EfficientFrontier
 
 from loguru import logger
 
 
+# Periods per year used to annualize daily return statistics
+TRADING_DAYS = 252
+
+# Risk-free rate PyPortfolioOpt uses for max_sharpe and its reported Sharpe ratios
+RISK_FREE_RATE = 0.02
+
+# Closed-form weights down to -_WEIGHT_TOL still count as long-only
+_WEIGHT_TOL = 1e-9
+
+# Portfolios (symbol set and lookback) whose rolling return moments are kept
+MOMENTS_CACHE_SIZE = 128
+
+# On-disk cache of daily price downloads, shared by all worker processes
+PRICE_CACHE_DIR = os.getenv(
+    "PRICE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "defiguard-price-cache")
+)
+PRICE_CACHE_TTL = 86400
+
+# Worker processes for the efficient-frontier sweep (per app worker process)
+FRONTIER_WORKERS = int(os.getenv("FRONTIER_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+@functools.lru_cache(maxsize=1)
+def _get_frontier_pool() -> ProcessPoolExecutor:
+    """Lazily start the shared process pool for frontier solves"""
+    # forkserver: forking the threaded server process directly is unsafe
+    return ProcessPoolExecutor(
+        max_workers=FRONTIER_WORKERS,
+        mp_context=multiprocessing.get_context("forkserver")
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _get_price_cache() -> diskcache.Cache:
+    """Open the on-disk price cache on first use"""
+    return diskcache.Cache(PRICE_CACHE_DIR)
+
+
+def _download_prices(tickers: Tuple[str, ...], start: date, end: date) -> pd.DataFrame:
+    """yf.download for a date range, cached on disk for PRICE_CACHE_TTL"""
+    cache = _get_price_cache()
+    key = ("yf.download", tickers, start.isoformat(), end.isoformat())
+    
+    data = cache.get(key)
+    if data is None:
+        # Tickers are fetched in parallel on yfinance's thread pool; dividend/split
+        # columns and the progress bar are never used
+        data = yf.download(
+            list(tickers),
+            start=start,
+            end=end,
+            group_by='ticker',
+            threads=True,
+            progress=False,
+            auto_adjust=False,
+            actions=False
+        )
+        if not data.empty:
+            cache.set(key, data, expire=PRICE_CACHE_TTL)
+    return data
+
+
+def _return_stats(r: np.ndarray) -> Tuple[float, float, float, float]:
+    """
+    Mean, sample volatility, downside volatility (negative days only), and
+    maximum drawdown of a daily return series, straight on the ndarray
+    """
+    mean = r.mean()
+    volatility = r.std(ddof=1)
+    downside = r[r < 0]
+    downside_volatility = downside.std(ddof=1) if len(downside) > 1 else np.nan
+    
+    wealth = np.cumprod(1 + r)
+    max_drawdown = (wealth / np.maximum.accumulate(wealth) - 1).min()
+    return mean, volatility, downside_volatility, max_drawdown
+
+
+def _percentile(r: np.ndarray, q: float) -> float:
+    """
+    np.percentile(r, q) with its default linear interpolation, selecting the
+    two bracketing order statistics with one partition call
+    """
+    position = q / 100 * (r.size - 1)
+    lo = int(position)
+    hi = min(lo + 1, r.size - 1)
+    selected = np.partition(r, [lo, hi])
+    return selected[lo] + (selected[hi] - selected[lo]) * (position - lo)
+
+
+def _ledoit_wolf(X: np.ndarray, S: np.ndarray) -> np.ndarray:
+    """
+    Ledoit-Wolf shrinkage towards the constant-correlation target, matching
+    PyPortfolioOpt's CovarianceShrinkage.ledoit_wolf("constant_correlation")
+    
+    X holds centered daily returns and S their sample covariance. S is taken
+    from the rolling moment sums instead of being rebuilt from X, which also
+    supplies X.T @ X = (t - 1) * S; only the fourth-moment terms of the
+    shrinkage intensity still need a pass over X.
+    """
+    t, n = X.shape
+    if n < 2:
+        return S
+    
+    var = np.diag(S)
+    std = np.sqrt(var)
+    outer_std = np.outer(std, std)
+    r_bar = ((S / outer_std).sum() - n) / (n * (n - 1))
+    F = r_bar * outer_std
+    np.fill_diagonal(F, var)
+    
+    help_ = S * ((t - 1) / t)
+    y = X ** 2
+    pi_mat = y.T @ y / t - 2 * help_ * S + S ** 2
+    theta = (y * X).T @ X / t - np.diag(help_)[:, None] * S - (help_ - S) * var[:, None]
+    np.fill_diagonal(theta, 0)
+    rho_hat = np.trace(pi_mat) + r_bar * (np.outer(1 / std, std) * theta).sum()
+    gamma_hat = ((S - F) ** 2).sum()
+    
+    # Zero-variance assets or an already constant-correlation sample: keep S
+    if not np.isfinite(rho_hat) or not gamma_hat > 0:
+        return S
+    delta = max(0.0, min(1.0, (pi_mat.sum() - rho_hat) / gamma_hat / t))
+    return delta * F + (1 - delta) * S
+
+
+def _solve_frontier_target(
+    mu: np.ndarray, 
+    S: np.ndarray, 
+    target_return: float,
+    weight_bounds: Tuple[Optional[float], Optional[float]] = (0, 1)
+) -> Optional[Tuple[float, float]]:
+    """Solve one efficient-frontier point; None when the target is infeasible"""
+    try:
+        ef = EfficientFrontier(mu, S, weight_bounds=weight_bounds)
+        ef.efficient_return(target_return)
+        ret, vol, _ = ef.portfolio_performance()
+        return ret, vol
+    except Exception:
+        return None
+
+
+def _solve_frontier_targets(
+    mu: np.ndarray, 
+    S: np.ndarray, 
+    target_returns: List[float],
+    weight_bounds: Tuple[Optional[float], Optional[float]] = (0, 1)
+) -> List[Optional[Tuple[float, float]]]:
+    """Solve a chunk of frontier points, so mu and S are pickled once per chunk"""
+    return [_solve_frontier_target(mu, S, target, weight_bounds) for target in target_returns]
+
+
+def _solve_frontier_in_pool(
+    mu: np.ndarray, 
+    S: np.ndarray, 
+    target_returns: List[float],
+    weight_bounds: Tuple[Optional[float], Optional[float]] = (0, 1)
+) -> List[Optional[Tuple[float, float]]]:
+    """
+    Solve frontier points across the worker pool, one chunk per worker
+    
+    If a worker has died the pool is broken for good: it is shut down and
+    dropped so the next call starts a fresh one, and this call solves
+    in-process instead.
+    """
+    chunks = [chunk.tolist() for chunk in np.array_split(target_returns, min(FRONTIER_WORKERS, len(target_returns)))]
+    pool = _get_frontier_pool()
+    try:
+        solved = pool.map(
+            _solve_frontier_targets,
+            itertools.repeat(mu),
+            itertools.repeat(S),
+            chunks,
+            itertools.repeat(weight_bounds)
+        )
+        return list(itertools.chain.from_iterable(solved))
+    except BrokenProcessPool as e:
+        logger.warning(f"⚠️ Frontier pool broken, solving in-process: {e}")
+        pool.shutdown(wait=False, cancel_futures=True)
+        # Another thread may already have replaced it
+        if _get_frontier_pool() is pool:
+            _get_frontier_pool.cache_clear()
+        return _solve_frontier_targets(mu, S, target_returns, weight_bounds)
+
+
+@dataclass(frozen=True, slots=True)
+class PortfolioContext:
+    """
+    Inputs shared by every sub-analysis of one portfolio request, built once
+    as plain ndarrays so the helpers never go back through pandas
+    """
+    returns: np.ndarray
+    assets: List[str]
+    mu: np.ndarray
+    S: np.ndarray
+    w: np.ndarray
+    analysis_date: str
+
+
+@dataclass
+class RollingMoments:
+    """
+    Running sums behind the annualized return and covariance estimates of a
+    returns window
+    
+    When the next request's window overlaps this one (the same history shifted
+    by k new days), the sums are updated by the k rows that left and the k
+    that entered, in O(kN^2) instead of a full O(TN^2) rebuild.
+    """
+    index: pd.Index
+    values: np.ndarray
+    total: np.ndarray
+    log_total: np.ndarray
+    cross: np.ndarray
+    
+    @classmethod
+    def from_returns(cls, index: pd.Index, values: np.ndarray) -> "RollingMoments":
+        return cls(index, values, values.sum(axis=0), np.log1p(values).sum(axis=0), values.T @ values)
+    
+    def slide(self, index: pd.Index, values: np.ndarray) -> bool:
+        """Move to a later overlapping window; False if it is not reachable incrementally"""
+        start = self.index.searchsorted(index[0])
+        overlap = len(self.index) - start
+        added = len(index) - overlap
+        # Revised history, a disjoint window, or more churn than a rebuild costs
+        if (
+            overlap <= 0 or added < 0 or start + added >= overlap
+            or not self.index[start:].equals(index[:overlap])
+            or not np.array_equal(self.values[start:], values[:overlap])
+        ):
+            return False
+        
+        dropped, entered = self.values[:start], values[overlap:]
+        self.total += entered.sum(axis=0) - dropped.sum(axis=0)
+        self.log_total += np.log1p(entered).sum(axis=0) - np.log1p(dropped).sum(axis=0)
+        self.cross += entered.T @ entered - dropped.T @ dropped
+        self.index, self.values = index, values
+        return True
+    
+    def estimates(self, frequency: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compounded annual returns and annualized sample covariance, matching
+        PyPortfolioOpt's mean_historical_return and sample_cov
+        """
+        n = len(self.values)
+        mu = np.expm1(self.log_total * frequency / n)
+        mean = self.total / n
+        cov = (self.cross - n * np.outer(mean, mean)) / (n - 1)
+        return mu, cov * frequency
+
+
+class ClosedFormFrontier:
+    """
+    Unconstrained mean-variance frontier in closed form (two-fund theorem)
+    
+    Every frontier portfolio is w(rho) = f + rho * g, derived from one solve
+    against the covariance matrix instead of a QP per point. Where those
+    weights are all non-negative they are also the long-only optimum.
+    """
+    
+    def __init__(self, mu: np.ndarray, S: np.ndarray):
+        ones = np.ones(len(mu))
+        self.Q_ones, self.Q_mu = np.linalg.solve(S, np.column_stack([ones, mu])).T
+        self.a11 = ones @ self.Q_ones
+        self.a12 = mu @ self.Q_ones
+        self.a22 = mu @ self.Q_mu
+        self.d = self.a11 * self.a22 - self.a12 ** 2
+        if not np.isfinite(self.d) or self.d <= 0:
+            raise np.linalg.LinAlgError("Degenerate frontier: expected returns do not vary across assets")
+        
+        self.f = (self.a22 * self.Q_ones - self.a12 * self.Q_mu) / self.d
+        self.g = (self.a11 * self.Q_mu - self.a12 * self.Q_ones) / self.d
+    
+    def frontier(self, target_returns: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Weights (one row per target) and volatilities of the frontier portfolios"""
+        weights = self.f + np.outer(target_returns, self.g)
+        risks = np.sqrt(self.a11 / self.d * (target_returns - self.a12 / self.a11) ** 2 + 1 / self.a11)
+        return weights, risks
+    
+    def min_volatility(self) -> np.ndarray:
+        """Weights of the global minimum-variance portfolio"""
+        return self.Q_ones / self.a11
+    
+    def max_sharpe(self, risk_free_rate: float) -> Optional[np.ndarray]:
+        """Weights of the tangency portfolio; None if no portfolio beats the risk-free rate"""
+        denominator = self.a12 - risk_free_rate * self.a11
+        if denominator <= 0:
+            return None
+        return (self.Q_mu - risk_free_rate * self.Q_ones) / denominator
+
+
 class RiskAnalysisService:
     """Advanced portfolio risk analysis using modern portfolio theory"""
     
-    def __init__(self):
+    def __init__(self, use_fp32: bool = False, shrink_covariance: bool = False):
+        # Store prices and returns as float32 to halve memory traffic; moment
+        # sums and solver inputs stay float64
+        self.use_fp32 = use_fp32
+        # Build the efficient frontier on the Ledoit-Wolf shrunk covariance
+        # instead of the sample covariance
+        self.shrink_covariance = shrink_covariance
+        
         self.crypto_symbol_mapping = {
             'ETH': 'ETH-USD',
             'BTC': 'BTC-USD', 
@@ -47,6 +346,16 @@ class RiskAnalysisService:
             'SUSHI': 'SUSHI-USD'
         }
         
+        # Rolling return moments keyed by (symbols, lookback_days)
+        self._moments_cache: Dict[Tuple[Tuple[str, ...], int], RollingMoments] = {}
+    
+    async def close(self):
+        """Shut down the frontier worker pool"""
+        # Only shut the pool down if a request actually started it
+        if _get_frontier_pool.cache_info().currsize:
+            _get_frontier_pool().shutdown(wait=False, cancel_futures=True)
+            _get_frontier_pool.cache_clear()
+        
     async def get_portfolio_risk_analysis(
         self,
         portfolio_data: Dict[str, float], 
@@ -77,24 +386,43 @@ class RiskAnalysisService:
             total_value = sum(portfolio_data.values())
             weights = {symbol: value / total_value for symbol, value in portfolio_data.items()}
             
-            # Run all analyses
-            results = {}
-            
-            # 1. Risk Contribution Analysis (Riskfolio-Lib)
-            risk_contrib = await self._calculate_risk_contribution(prices_df, weights)
-            results['risk_contribution'] = risk_contrib
-            
-            # 2. Asset Correlation Heatmap
-            correlation_data = await self._calculate_correlation_matrix(prices_df)
-            results['correlation'] = correlation_data
+            # Daily returns, the annualized return/covariance estimates, and the
+            # weight vector aligned to the assets with price data are shared by
+            # every analysis below
+            # Prices arrive with NaN rows already dropped, so only the first
+            # return is undefined; slice it off rather than scan for NaNs
+            returns = prices_df.pct_change().iloc[1:]
+            mu, S = self._return_estimates(returns, lookback_days)
+            ctx = PortfolioContext(
+                returns=returns.to_numpy(),
+                assets=list(returns.columns),
+                mu=mu,
+                S=S,
+                w=self._aligned_weights(weights, returns.columns),
+                analysis_date=datetime.utcnow().isoformat()
+            )
             
-            # 3. Efficient Frontier Analysis (PyPortfolioOpt)
-            efficient_frontier = await self._calculate_efficient_frontier(prices_df, weights)
-            results['efficient_frontier'] = efficient_frontier
+            # Run all analyses concurrently in worker threads; they are
+            # independent, CPU-bound, and NumPy/solver code releases the GIL
+            risk_contrib, correlation_data, efficient_frontier, portfolio_metrics = await asyncio.gather(
+                # 1. Risk Contribution Analysis (Euler shares of portfolio volatility)
+                asyncio.to_thread(self._calculate_risk_contribution, ctx),
+                # 2. Asset Correlation Heatmap
+                asyncio.to_thread(self._calculate_correlation_matrix, ctx),
+                # 3. Efficient Frontier Analysis (PyPortfolioOpt)
+                asyncio.to_thread(
+                    self._calculate_efficient_frontier, ctx, shrink_covariance=self.shrink_covariance
+                ),
+                # 4. Portfolio Metrics Summary
+                asyncio.to_thread(self._calculate_portfolio_metrics, ctx)
+            )
             
-            # 4. Portfolio Metrics Summary
-            portfolio_metrics = await self._calculate_portfolio_metrics(prices_df, weights)
-            results['portfolio_metrics'] = portfolio_metrics
+            results = {
+                'risk_contribution': risk_contrib,
+                'correlation': correlation_data,
+                'efficient_frontier': efficient_frontier,
+                'portfolio_metrics': portfolio_metrics
+            }
             
             logger.info(f"✅ Risk analysis completed for {len(portfolio_data)} assets")
             return results
@@ -103,6 +431,29 @@ class RiskAnalysisService:
             logger.error(f"❌ Risk analysis failed: {e}")
             return {"error": str(e)}
     
+    @staticmethod
+    def _aligned_weights(weights: Dict[str, float], assets: pd.Index) -> np.ndarray:
+        """Weights for the assets with price data, in column order, renormalized to sum to 1"""
+        w = np.array([weights.get(symbol, 0.0) for symbol in assets], dtype=float)
+        total_weight = w.sum()
+        return w / total_weight if total_weight > 0 else w
+    
+    def _return_estimates(self, returns: pd.DataFrame, lookback_days: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Annualized expected returns and covariance, updated incrementally across requests"""
+        key = (tuple(returns.columns), lookback_days)
+        # Running sums are updated by subtraction, so they always accumulate in float64
+        values = returns.to_numpy(dtype=np.float64)
+        
+        # Re-inserted below so the dict stays ordered least to most recently used
+        moments = self._moments_cache.pop(key, None)
+        if moments is None or not moments.slide(returns.index, values):
+            moments = RollingMoments.from_returns(returns.index, values)
+        self._moments_cache[key] = moments
+        if len(self._moments_cache) > MOMENTS_CACHE_SIZE:
+            del self._moments_cache[next(iter(self._moments_cache))]
+        
+        return moments.estimates(TRADING_DAYS)
+    
     async def _fetch_historical_prices(
         self, 
         symbols: List[str], 
@@ -110,7 +461,9 @@ class RiskAnalysisService:
     ) -> Optional[pd.DataFrame]:
         """Fetch historical price data for crypto assets"""
         try:
-            end_date = datetime.now()
+            # Whole days (end exclusive, so today's bar is included) keep the
+            # download cache key stable for the day
+            end_date = date.today() + timedelta(days=1)
             start_date = end_date - timedelta(days=lookback_days)
             
             # Map crypto symbols to Yahoo Finance tickers
@@ -129,7 +482,9 @@ class RiskAnalysisService:
             
             # Download price data
             logger.info(f"📈 Fetching {lookback_days} days of price data for: {yf_symbols}")
-            data = yf.download(yf_symbols, start=start_date, end=end_date, group_by='ticker')
+            # One batched yf.download, run off the event loop: it blocks on the
+            # network and on the disk cache
+            data = await asyncio.to_thread(_download_prices, tuple(sorted(yf_symbols)), start_date, end_date)
             
             if data.empty:
                 return None
@@ -151,6 +506,8 @@ class RiskAnalysisService:
             # Remove any assets with insufficient data
             prices = prices.dropna(axis=1, thresh=len(prices) * 0.8)
             prices = prices.dropna()
+            if self.use_fp32:
+                prices = prices.astype(np.float32)
             
             logger.info(f"📊 Retrieved price data: {prices.shape[0]} days, {prices.shape[1]} assets")
             return prices
@@ -159,86 +516,63 @@ class RiskAnalysisService:
             logger.error(f"❌ Price fetch failed: {e}")
             return None
     
-    async def _calculate_risk_contribution(
-        self, 
-        prices_df: pd.DataFrame, 
-        weights: Dict[str, float]
-    ) -> Dict[str, Any]:
-        """Calculate risk contribution using Riskfolio-Lib"""
+    def _calculate_risk_contribution(self, ctx: PortfolioContext) -> Dict[str, Any]:
+        """Calculate each asset's share of portfolio volatility (Euler risk contributions)"""
         try:
-            # Calculate returns
-            returns = prices_df.pct_change().dropna()
-            
-            # Filter weights to match available price data
-            available_symbols = list(returns.columns)
-            filtered_weights = {k: v for k, v in weights.items() if k in available_symbols}
-            
-            # Normalize weights
-            total_weight = sum(filtered_weights.values())
-            if total_weight > 0:
-                filtered_weights = {k: v / total_weight for k, v in filtered_weights.items()}
-            
-            # Create portfolio object
-            port = rp.Portfolio(returns=returns)
-            
-            # Calculate the risk model
-            port.assets_stats(method_mu='hist', method_cov='hist')
-            
-            # Convert weights to Series
-            w = pd.Series(index=returns.columns, dtype=float)
-            for symbol in returns.columns:
-                w[symbol] = filtered_weights.get(symbol, 0.0)
+            w = ctx.w
+            # Daily covariance: the shared annualized estimate de-annualized
+            cov = ctx.S / TRADING_DAYS
             
-            # Calculate risk contributions
-            risk_contrib = rp.RiskFunctions.Risk_Contribution(w, port.cov, None, None)
+            # Risk contributions w_i * (cov w)_i / (w' cov w) sum to 1
+            cov_w = cov @ w
+            portfolio_variance = w @ cov_w
+            risk_contrib = w * cov_w / portfolio_variance if portfolio_variance > 0 else np.zeros_like(w)
             
             # Convert to percentage and prepare for frontend
             risk_contrib_pct = (risk_contrib * 100).round(2)
             
             risk_data = []
-            for symbol, contribution in risk_contrib_pct.items():
+            for symbol, contribution, weight in zip(ctx.assets, risk_contrib_pct.tolist(), (w * 100).tolist()):
                 risk_data.append({
                     'asset': symbol,
-                    'risk_contribution': float(contribution),
-                    'portfolio_weight': float(filtered_weights.get(symbol, 0) * 100)
+                    'risk_contribution': contribution,
+                    'portfolio_weight': weight
                 })
             
             logger.info(f"✅ Risk contribution calculated for {len(risk_data)} assets")
             
             return {
                 'data': risk_data,
-                'total_portfolio_risk': float(np.sqrt(w.T @ port.cov @ w) * 100),
-                'analysis_date': datetime.now().isoformat()
+                'total_portfolio_risk': float(np.sqrt(portfolio_variance) * 100),
+                'analysis_date': ctx.analysis_date
             }
             
         except Exception as e:
             logger.error(f"❌ Risk contribution calculation failed: {e}")
             return {'error': str(e)}
     
-    async def _calculate_correlation_matrix(
-        self, 
-        prices_df: pd.DataFrame
-    ) -> Dict[str, Any]:
+    def _calculate_correlation_matrix(self, ctx: PortfolioContext) -> Dict[str, Any]:
         """Calculate asset correlation matrix"""
         try:
-            # Calculate returns and correlation matrix
-            returns = prices_df.pct_change().dropna()
-            corr_matrix = returns.corr()
-            
-            # Convert to format suitable for heatmap
-            correlation_data = []
-            assets = list(corr_matrix.columns)
-            
-            for i, asset1 in enumerate(assets):
-                for j, asset2 in enumerate(assets):
-                    correlation_data.append({
-                        'asset1': asset1,
-                        'asset2': asset2,
-                        'correlation': float(corr_matrix.iloc[i, j])
-                    })
+            # Calculate correlation matrix on the raw ndarray (atleast_2d: a
+            # single asset comes back from corrcoef as a scalar)
+            corr_values = np.atleast_2d(np.corrcoef(ctx.returns, rowvar=False))
+            
+            # Convert to format suitable for heatmap: one row per (asset1, asset2)
+            # pair in row-major order, built from flat columns
+            assets = ctx.assets
+            names = np.asarray(assets, dtype=object)
+            correlation_data = [
+                {'asset1': asset1, 'asset2': asset2, 'correlation': correlation}
+                for asset1, asset2, correlation in zip(
+                    np.repeat(names, len(assets)).tolist(),
+                    np.tile(names, len(assets)).tolist(),
+                    corr_values.ravel().tolist()
+                )
+            ]
             
             # Summary statistics
-            off_diagonal = corr_matrix.values[np.triu_indices_from(corr_matrix.values, k=1)]
+            off_diagonal = corr_values[np.triu_indices(len(assets), k=1)]
             avg_correlation = float(np.mean(off_diagonal))
             max_correlation = float(np.max(off_diagonal))
             min_correlation = float(np.min(off_diagonal))
@@ -254,71 +588,99 @@ class RiskAnalysisService:
                     'min_correlation': min_correlation,
                     'diversification_ratio': 1 - avg_correlation  # Simple diversification measure
                 },
-                'analysis_date': datetime.now().isoformat()
+                'analysis_date': ctx.analysis_date
             }
             
         except Exception as e:
             logger.error(f"❌ Correlation calculation failed: {e}")
             return {'error': str(e)}
     
-    async def _calculate_efficient_frontier(
+    def _calculate_efficient_frontier(
         self, 
-        prices_df: pd.DataFrame, 
-        weights: Dict[str, float]
+        ctx: PortfolioContext,
+        long_only: bool = True,
+        shrink_covariance: bool = False
     ) -> Dict[str, Any]:
-        """Calculate efficient frontier using PyPortfolioOpt"""
+        """
+        Calculate efficient frontier
+        
+        Portfolios come from the closed-form frontier wherever its weights
+        satisfy the constraints; only the rest fall back to PyPortfolioOpt
+        solves (long-only unless long_only is False). With shrink_covariance
+        the sample covariance is first replaced by its Ledoit-Wolf estimate.
+        """
         try:
-            # Calculate returns
-            returns = prices_df.pct_change().dropna()
+            mu = ctx.mu
+            S = ctx.S
+            if shrink_covariance:
+                X = ctx.returns.astype(np.float64, copy=False)
+                S = _ledoit_wolf(X - X.mean(axis=0), S / TRADING_DAYS) * TRADING_DAYS
             
-            # Calculate expected returns and covariance
-            mu = expected_returns.mean_historical_return(prices_df)
-            S = risk_models.sample_cov(prices_df)
+            weight_bounds = (0, 1) if long_only else (None, None)
             
-            # Create efficient frontier
-            ef = EfficientFrontier(mu, S)
+            try:
+                closed_form = ClosedFormFrontier(mu, S)
+            except np.linalg.LinAlgError:
+                closed_form = None
             
-            # Generate efficient frontier points
-            frontier_points = []
-            min_vol_ret, min_vol_risk = ef.portfolio_performance()
-            ef = EfficientFrontier(mu, S)  # Reset
+            def admissible(candidate: Optional[np.ndarray]) -> bool:
+                return candidate is not None and (not long_only or candidate.min() >= -_WEIGHT_TOL)
             
-            # Calculate max return portfolio
-            ef.max_sharpe()
-            max_sharpe_ret, max_sharpe_risk, max_sharpe_ratio = ef.portfolio_performance()
-            ef = EfficientFrontier(mu, S)  # Reset
+            def performance(portfolio: np.ndarray) -> Tuple[float, float]:
+                return float(portfolio @ mu), float(np.sqrt(portfolio @ S @ portfolio))
             
-            # Generate points along the frontier
-            target_returns = np.linspace(min_vol_ret, mu.max(), 20)
+            # Minimum volatility portfolio anchors the low end of the frontier
+            w_min = closed_form.min_volatility() if closed_form else None
+            if admissible(w_min):
+                min_vol_ret, min_vol_risk = performance(w_min)
+            else:
+                ef = EfficientFrontier(mu, S, weight_bounds=weight_bounds)
+                ef.min_volatility()
+                min_vol_ret, min_vol_risk, _ = ef.portfolio_performance()
+            
+            # Calculate max Sharpe portfolio
+            w_tangency = closed_form.max_sharpe(RISK_FREE_RATE) if closed_form else None
+            if admissible(w_tangency):
+                max_sharpe_ret, max_sharpe_risk = performance(w_tangency)
+                max_sharpe_ratio = (max_sharpe_ret - RISK_FREE_RATE) / max_sharpe_risk
+            else:
+                ef = EfficientFrontier(mu, S, weight_bounds=weight_bounds)
+                ef.max_sharpe(risk_free_rate=RISK_FREE_RATE)
+                max_sharpe_ret, max_sharpe_risk, max_sharpe_ratio = ef.portfolio_performance(
+                    risk_free_rate=RISK_FREE_RATE
+                )
             
-            for target_return in target_returns:
-                try:
-                    ef_temp = EfficientFrontier(mu, S)
-                    ef_temp.efficient_return(target_return)
-                    ret, vol, _ = ef_temp.portfolio_performance()
-                    frontier_points.append({
-                        'return': float(ret * 100),  # Convert to percentage
-                        'risk': float(vol * 100),
-                        'sharpe_ratio': float(ret / vol) if vol > 0 else 0
-                    })
-                except:
-                    continue
-            
-            # Calculate current portfolio performance
-            available_symbols = list(returns.columns)
-            filtered_weights = {k: v for k, v in weights.items() if k in available_symbols}
-            total_weight = sum(filtered_weights.values())
-            if total_weight > 0:
-                filtered_weights = {k: v / total_weight for k, v in filtered_weights.items()}
-            
-            # Convert to pandas Series for calculation
-            w = pd.Series(index=mu.index, dtype=float)
-            for symbol in mu.index:
-                w[symbol] = filtered_weights.get(symbol, 0.0)
+            # Generate points along the frontier, collected as return/risk columns
+            target_returns = np.linspace(min_vol_ret, mu.max(), 20)
+            points: List[Optional[Tuple[float, float]]] = [None] * len(target_returns)
+            
+            if closed_form:
+                frontier_weights, frontier_vols = closed_form.frontier(target_returns)
+                for i, (w_target, vol) in enumerate(zip(frontier_weights, frontier_vols)):
+                    if admissible(w_target):
+                        points[i] = (float(target_returns[i]), float(vol))
+            
+            # Targets where the constraints bind need a QP each; those solves are
+            # independent, so they run in worker processes
+            unsolved = [i for i, point in enumerate(points) if point is None]
+            if unsolved:
+                solved = _solve_frontier_in_pool(mu, S, target_returns[unsolved].tolist(), weight_bounds)
+                for i, point in zip(unsolved, solved):
+                    points[i] = point
+            
+            solved_points = [point for point in points if point is not None]
+            frontier_returns = [ret for ret, _ in solved_points]
+            frontier_risks = [vol for _, vol in solved_points]
+            
+            frontier_points = self._frontier_points(
+                np.asarray(frontier_returns, dtype=float),
+                np.asarray(frontier_risks, dtype=float)
+            )
             
             # Current portfolio metrics
-            current_return = float((w * mu).sum() * 100)
-            current_risk = float(np.sqrt(w.T @ S @ w) * 100)
+            current_return, current_risk = performance(ctx.w)
+            current_return *= 100
+            current_risk *= 100
             current_sharpe = current_return / current_risk if current_risk > 0 else 0
             
             logger.info(f"✅ Efficient frontier calculated with {len(frontier_points)} points")
@@ -342,52 +704,45 @@ class RiskAnalysisService:
                         'sharpe_ratio': float(min_vol_ret / min_vol_risk)
                     }
                 },
-                'analysis_date': datetime.now().isoformat()
+                'analysis_date': ctx.analysis_date
             }
             
         except Exception as e:
             logger.error(f"❌ Efficient frontier calculation failed: {e}")
             return {'error': str(e)}
     
-    async def _calculate_portfolio_metrics(
-        self, 
-        prices_df: pd.DataFrame, 
-        weights: Dict[str, float]
-    ) -> Dict[str, Any]:
+    @staticmethod
+    def _frontier_points(returns: np.ndarray, risks: np.ndarray) -> List[Dict[str, float]]:
+        """Convert frontier return/risk columns into percentage points with Sharpe ratios"""
+        sharpe = np.divide(returns, risks, out=np.zeros_like(returns), where=risks > 0)
+        return [
+            {'return': ret, 'risk': risk, 'sharpe_ratio': ratio}
+            for ret, risk, ratio in zip((returns * 100).tolist(), (risks * 100).tolist(), sharpe.tolist())
+        ]
+    
+    def _calculate_portfolio_metrics(self, ctx: PortfolioContext) -> Dict[str, Any]:
         """Calculate comprehensive portfolio risk metrics"""
         try:
-            returns = prices_df.pct_change().dropna()
-            
-            # Filter weights to available data
-            available_symbols = list(returns.columns)
-            filtered_weights = {k: v for k, v in weights.items() if k in available_symbols}
-            total_weight = sum(filtered_weights.values())
-            if total_weight > 0:
-                filtered_weights = {k: v / total_weight for k, v in filtered_weights.items()}
-            
             # Calculate portfolio returns
-            portfolio_returns = returns @ pd.Series(filtered_weights)
+            portfolio_returns = ctx.returns @ ctx.w.astype(ctx.returns.dtype, copy=False)
+            mean_return, volatility, downside_volatility, drawdown = _return_stats(portfolio_returns)
             
             # Calculate metrics
-            annual_return = float(portfolio_returns.mean() * 252 * 100)  # Annualized %
-            annual_volatility = float(portfolio_returns.std() * np.sqrt(252) * 100)  # Annualized %
+            annual_return = float(mean_return * TRADING_DAYS * 100)  # Annualized %
+            annual_volatility = float(volatility * np.sqrt(TRADING_DAYS) * 100)  # Annualized %
             sharpe_ratio = annual_return / annual_volatility if annual_volatility > 0 else 0
             
             # Value at Risk (VaR) - 95% confidence
-            var_95 = float(np.percentile(portfolio_returns, 5) * 100)
+            var_95 = float(_percentile(portfolio_returns, 5) * 100)
             
             # Maximum Drawdown
-            cumulative_returns = (1 + portfolio_returns).cumprod()
-            running_max = cumulative_returns.expanding().max()
-            drawdowns = (cumulative_returns - running_max) / running_max
-            max_drawdown = float(drawdowns.min() * 100)
+            max_drawdown = float(drawdown * 100)
             
             # Calmar Ratio
             calmar_ratio = annual_return / abs(max_drawdown) if max_drawdown != 0 else 0
             
             # Sortino Ratio (using downside deviation)
-            downside_returns = portfolio_returns[portfolio_returns < 0]
-            downside_deviation = float(downside_returns.std() * np.sqrt(252) * 100)
+            downside_deviation = float(downside_volatility * np.sqrt(TRADING_DAYS) * 100)
             sortino_ratio = annual_return / downside_deviation if downside_deviation > 0 else 0
             
             logger.info("✅ Portfolio metrics calculated successfully")
@@ -400,8 +755,8 @@ class RiskAnalysisService:
                 'max_drawdown': max_drawdown,
                 'calmar_ratio': float(calmar_ratio),
                 'sortino_ratio': float(sortino_ratio),
-                'analysis_period_days': len(returns),
-                'analysis_date': datetime.now().isoformat()
+                'analysis_period_days': len(ctx.returns),
+                'analysis_date': ctx.analysis_date
             }
             
         except Exception as e:
@@ -0,0 +1,36 @@
+"""
+Epoch-millisecond timestamps accept and publish ISO-8601 datetimes
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from models.api_models import ErrorResponse, SuccessResponse
+
+
+@pytest.mark.parametrize("mode", ["validation", "serialization"])
+def test_timestamp_schema_is_iso_string(mode):
+    schema = ErrorResponse.model_json_schema(mode=mode)["properties"]["timestamp"]
+
+    assert schema["type"] == "string"
+    assert schema["format"] == "date-time"
+
+
+@pytest.mark.parametrize("timestamp", [
+    "2026-10-15T12:00:00.123",
+    "2026-10-15T12:00:00.123Z",
+    datetime(2026, 10, 15, 12, 0, 0, 123000),
+    datetime(2026, 10, 15, 12, 0, 0, 123000, tzinfo=timezone.utc),
+    1_792_065_600_123
+])
+def test_timestamp_accepts_iso_datetime_and_epoch_ms(timestamp):
+    response = SuccessResponse(message="ok", timestamp=timestamp)
+
+    assert response.model_dump()["timestamp"] == "2026-10-15T12:00:00.123000"
+
+
+def test_timestamp_round_trips_through_json():
+    response = ErrorResponse(error="boom")
+
+    assert ErrorResponse.model_validate_json(response.model_dump_json()) == response
@@ -0,0 +1,79 @@
+"""
+Raw CDP balance rows are valued and scaled correctly
+"""
+
+import asyncio
+
+import pytest
+
+import services.coinbase_service as coinbase_module
+from services.coinbase_service import DeFiGuardCoinbaseService
+
+ROWS = [
+    {
+        "address": "0xeth",
+        "symbol": "ETH",
+        "name": "Ethereum",
+        "amount": "1234500000000000000",
+        "decimals": 18,
+        "price_usd": 2500.0
+    },
+    {
+        "address": "0xusdc",
+        "symbol": "USDC",
+        "name": "USD Coin",
+        "amount": "100000",
+        "decimals": 6,
+        "price_usd": 1.0,
+        "logo_url": "https://example.com/usdc.png"
+    },
+    {
+        "address": "0xdust",
+        "symbol": "DUST",
+        "name": "Dust",
+        "amount": "1",
+        "decimals": 0,
+        "price_usd": None
+    }
+]
+
+
+def test_process_balances_scales_by_decimals():
+    batch = DeFiGuardCoinbaseService._process_balances(ROWS)
+
+    assert len(batch) == 3
+    # Exact decimal strings, no float rounding or trailing zeros
+    assert batch.balances == ["1.2345", "0.1", "1"]
+    assert batch.decimals.tolist() == [18, 6, 0]
+    assert batch.values_usd.tolist() == pytest.approx([3086.25, 0.1, 0.0])
+    assert batch.prices_usd.tolist() == [2500.0, 1.0, 0.0]
+    assert batch.logo_urls == [None, "https://example.com/usdc.png", None]
+
+
+def test_process_balances_total_in_micro_usd():
+    rows = [dict(ROWS[1], amount="100000"), dict(ROWS[1], amount="200000")]
+    batch = DeFiGuardCoinbaseService._process_balances(rows)
+
+    # 0.1 + 0.2 summed in micro-USD, not as binary floats
+    assert batch.total_value_usd == 0.3
+
+
+def test_process_balances_empty():
+    batch = DeFiGuardCoinbaseService._process_balances([])
+
+    assert len(batch) == 0
+    assert batch.to_aos() == []
+    assert batch.total_value_usd == 0.0
+
+
+def test_fetch_chain_tokens_goes_through_process_balances(monkeypatch):
+    monkeypatch.setattr(coinbase_module, "CdpClient", object)
+    service = DeFiGuardCoinbaseService("key-id", "key-secret", "redis://localhost:6379")
+
+    tokens, total_value_usd = asyncio.run(service._fetch_chain_tokens("0xwallet", "ethereum"))
+
+    assert [(token.symbol, token.balance, token.value_usd) for token in tokens] == [
+        ("ETH", "1.5", 3750.0),
+        ("USDC", "1000", 1000.0)
+    ]
+    assert total_value_usd == 4750.0
@@ -0,0 +1,34 @@
+"""
+Response models are defined once, so every import sees the same class
+"""
+
+import ast
+import importlib
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+MODELS_DIR = Path(__file__).resolve().parent.parent / "models"
+
+
+def test_no_model_class_is_defined_twice():
+    names = Counter()
+    for path in MODELS_DIR.glob("*.py"):
+        tree = ast.parse(path.read_text(), filename=str(path))
+        names.update(node.name for node in tree.body if isinstance(node, ast.ClassDef))
+
+    duplicates = sorted(name for name, count in names.items() if count > 1)
+    assert not duplicates, f"Model classes defined more than once: {duplicates}"
+
+
+@pytest.mark.parametrize("name", ["AssetRisk", "AIRecommendationResponse"])
+def test_single_class_identity(name):
+    api_models = importlib.import_module("models.api_models")
+    portfolio_models = importlib.import_module("models.portfolio_models")
+
+    cls = getattr(api_models, name)
+    assert cls.__module__ == "models.api_models"
+    # A second definition (or a re-export of a different class) would break
+    # isinstance checks across modules
+    assert getattr(portfolio_models, name, cls) is cls
@@ -0,0 +1,39 @@
+"""
+Column-oriented token batches convert back to per-token balances exactly
+"""
+
+import numpy as np
+
+from models.portfolio_models import TokenBalance, TokenBalanceBatch, sum_usd
+
+
+def make_batch() -> TokenBalanceBatch:
+    return TokenBalanceBatch(
+        addresses=["0xa", "0xb", "0xc"],
+        symbols=["ETH", "USDC", "LINK"],
+        names=["Ethereum", "USD Coin", "Chainlink"],
+        balances=["1.5", "0.1", "0.2"],
+        decimals=np.array([18, 6, 18], dtype=np.int32),
+        prices_usd=np.array([2500.0, 1.0, 1.0]),
+        values_usd=np.array([3750.0, 0.1, 0.2]),
+        logo_urls=[None, "https://example.com/usdc.png", None]
+    )
+
+
+def test_to_aos_round_trips_every_column():
+    tokens = make_batch().to_aos()
+
+    assert tokens == [
+        TokenBalance("0xa", "ETH", "Ethereum", "1.5", 18, 2500.0, 3750.0, None),
+        TokenBalance("0xb", "USDC", "USD Coin", "0.1", 6, 1.0, 0.1, "https://example.com/usdc.png"),
+        TokenBalance("0xc", "LINK", "Chainlink", "0.2", 18, 1.0, 0.2, None)
+    ]
+    # Plain Python scalars, so the tokens serialize like hand-built ones
+    assert all(type(token.decimals) is int and type(token.value_usd) is float for token in tokens)
+
+
+def test_total_value_matches_sum_usd():
+    batch = make_batch()
+
+    assert batch.total_value_usd == 3750.3
+    assert batch.total_value_usd == sum_usd(token.value_usd for token in batch.to_aos())
@@ -0,0 +1,74 @@
+"""
+Float32 mode of the risk analysis service must match float64 results
+"""
+
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import services.risk_analysis_service as risk_module
+from services.risk_analysis_service import RiskAnalysisService, _return_stats
+
+TOLERANCE = 1e-4
+TICKERS = ["ETH-USD", "BTC-USD", "SOL-USD", "LINK-USD"]
+PORTFOLIO = {"ETH": 4000.0, "BTC": 3000.0, "SOL": 2000.0, "LINK": 1000.0}
+
+
+@pytest.fixture
+def seeded_download(monkeypatch):
+    """Replace yf.download with a fixed, seeded year of daily closes"""
+    rng = np.random.default_rng(42)
+    index = pd.date_range("2024-01-01", periods=366, freq="D")
+    closes = 100 * np.exp(np.cumsum(rng.normal(5e-4, 0.03, (len(index), len(TICKERS))), axis=0))
+    columns = pd.MultiIndex.from_product([TICKERS, ["Close"]])
+    data = pd.DataFrame(closes, index=index, columns=columns)
+
+    def download(tickers, start, end):
+        return data[[(ticker, "Close") for ticker in tickers]]
+
+    monkeypatch.setattr(risk_module, "_download_prices", download)
+
+
+def run_analysis(use_fp32: bool) -> dict:
+    service = RiskAnalysisService(use_fp32=use_fp32)
+    # The frontier goes through the solver pool and is not affected by the
+    # storage dtype of returns beyond the shared estimates checked here
+    service._calculate_efficient_frontier = lambda ctx, **kwargs: {}
+    return asyncio.run(service.get_portfolio_risk_analysis(PORTFOLIO))
+
+
+def test_fp32_prices_are_float32(seeded_download):
+    prices = asyncio.run(RiskAnalysisService(use_fp32=True)._fetch_historical_prices(list(PORTFOLIO), 365))
+    assert (prices.dtypes == np.float32).all()
+
+
+def test_return_stats_match_fp64(seeded_download):
+    prices = asyncio.run(RiskAnalysisService()._fetch_historical_prices(list(PORTFOLIO), 365))
+    w = np.array([0.4, 0.3, 0.2, 0.1])
+
+    r64 = prices.pct_change().iloc[1:].to_numpy() @ w
+    r32 = prices.astype(np.float32).pct_change().iloc[1:].to_numpy() @ w.astype(np.float32)
+
+    assert _return_stats(r32) == pytest.approx(_return_stats(r64), rel=TOLERANCE)
+
+
+def test_portfolio_metrics_match_fp64(seeded_download):
+    metrics64 = run_analysis(use_fp32=False)["portfolio_metrics"]
+    metrics32 = run_analysis(use_fp32=True)["portfolio_metrics"]
+
+    for name in ("annual_return", "annual_volatility", "sharpe_ratio", "var_95",
+                 "max_drawdown", "calmar_ratio", "sortino_ratio"):
+        assert metrics32[name] == pytest.approx(metrics64[name], rel=TOLERANCE), name
+
+
+def test_risk_contribution_matches_fp64(seeded_download):
+    contrib64 = run_analysis(use_fp32=False)["risk_contribution"]
+    contrib32 = run_analysis(use_fp32=True)["risk_contribution"]
+
+    assert contrib32["total_portfolio_risk"] == pytest.approx(contrib64["total_portfolio_risk"], rel=TOLERANCE)
+    for row32, row64 in zip(contrib32["data"], contrib64["data"]):
+        assert row32["asset"] == row64["asset"]
+        # Shares are rounded to 2 decimals, so compare at that resolution
+        assert row32["risk_contribution"] == pytest.approx(row64["risk_contribution"], abs=0.011)